@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mariadb
+
+
+# Bounded, thread-safe pool of persistent MariaDB connections.
+# - at most `size` connections are open at the same time
+# - a connection that was idle longer than `ping_after_sec` is pinged before use
+#   and replaced if the server dropped it
+# - a connection that raised a connection-level error is closed instead of reused
+class ConnectionPool:
+    def __init__(self, config, size=5, timeout=10, ping_after_sec=30):
+        self.config = config
+        self.size = int(size)
+        self.timeout = float(timeout)
+        self.ping_after_sec = float(ping_after_sec)
+
+        self._idle = queue.LifoQueue()  # (conn, last_used) - LIFO keeps hot connections hot
+        self._lock = threading.Lock()
+        self._open_count = 0  # idle + in use
+
+        self.stats = {
+            "acquired": 0,
+            "opened": 0,
+            "reconnects": 0,
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    def _open(self):
+        conn = mariadb.connect(**self.config)
+        with self._lock:
+            self.stats["opened"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open_count -= 1
+
+    # Returns (conn, last_used) - last_used is None for a brand-new connection
+    def _take(self, deadline):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            # room for one more connection?
+            with self._lock:
+                can_open = self._open_count < self.size
+                if can_open:
+                    self._open_count += 1
+            if can_open:
+                try:
+                    return self._open(), None
+                except Exception:
+                    with self._lock:
+                        self._open_count -= 1
+                    raise
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                raise mariadb.PoolError(f"no free connection after {self.timeout}s (pool size {self.size})")
+            try:
+                return self._idle.get(timeout=remaining)
+            except queue.Empty:
+                continue
+
+    def acquire(self):
+        start = time.monotonic()
+        conn, last_used = self._take(start + self.timeout)
+
+        # health check of connections that were sitting idle
+        if last_used is not None and start - last_used > self.ping_after_sec:
+            try:
+                conn.ping()
+            except mariadb.Error:
+                self._discard(conn)
+                with self._lock:
+                    self._open_count += 1
+                    self.stats["reconnects"] += 1
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._open_count -= 1
+                    raise
+
+        wait_ms = (time.monotonic() - start) * 1000.0
+        with self._lock:
+            self.stats["acquired"] += 1
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+        return conn
+
+    def release(self, conn, broken=False):
+        if broken:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    # with pool.connection() as conn: ...
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (mariadb.InterfaceError, mariadb.OperationalError):
+            # lost / stale connection -> do not give it back to the pool
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["size"] = self.size
+            out["open"] = self._open_count
+        out["idle"] = self._idle.qsize()
+        out["in_use"] = out["open"] - out["idle"]
+        out["wait_ms_avg"] = out["wait_ms_total"] / out["acquired"] if out["acquired"] else 0.0
+        return out
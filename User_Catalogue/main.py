@@ -158,6 +158,15 @@ class UserCatalogueAPI:
         chat_ids = self.db.get_chat_ids_by_device(str(device_id))
         return {"status": "ok", "device_id": str(device_id), "chat_ids": chat_ids}
 
+    # Returns db connection pool counters (pool wait time, reconnects, ...)
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def stats(self):
+        if cherrypy.request.method.upper() != "GET":
+            return json_error(405, "Method not allowed")
+
+        return {"status": "ok", "db_pool": self.db.pool.snapshot()}
+
 
  
 def main():
@@ -168,8 +177,10 @@ def main():
     service_name = service_cfg["name"]
     host = service_cfg["host"]
     port = int(service_cfg["port"])
+    thread_pool = int(service_cfg.get("thread_pool", 10))
 
     # DB settings (read only from config.json)
+    # one pooled connection per CherryPy worker thread, so a request never waits for a connection
     db_cfg = cfg["db"]
     db = MariaDB(
         db_cfg["host"],
@@ -177,6 +188,7 @@ def main():
         db_cfg["user"],
         db_cfg["password"],
         db_cfg["name"],
+        pool_size=int(db_cfg.get("pool_size", thread_pool)),
     )
 
     # Catalogue settings (read only from config.json)
@@ -187,10 +199,12 @@ def main():
     # Registers this service in the Service Catalogue so other components can discover it.
     registry = ServiceRegistry(catalog_host=catalog_host, catalog_port=catalog_port)
     registry.register(name=service_name, host=host, port=port)
+    registry.start_heartbeat()
 
     cherrypy.config.update({
         "server.socket_host": host,
-        "server.socket_port": port
+        "server.socket_port": port,
+        "server.thread_pool": thread_pool,
     })
 
     api = UserCatalogueAPI(db)
@@ -0,0 +1,28 @@
+--
+-- Range partitioning of `measurements` by `ts` (used by storage_service retention)
+-- Database: `smart_aquariums`
+--
+-- storage_service splits `pmax` into daily partitions ahead of time and drops
+-- partitions that are older than the "raw" retention tier (see storage_service/config.json).
+-- On its first run it also splits the rows already in `pmax` from the oldest one on
+-- (rows past the retention cutoff go into one partition that is dropped right away).
+--
+
+SET time_zone = "+00:00";
+
+-- --------------------------------------------------------
+
+--
+-- The partitioning column must be part of every unique key
+--
+ALTER TABLE `measurements`
+  DROP PRIMARY KEY,
+  ADD PRIMARY KEY (`id`,`ts`);
+
+--
+-- Start with a single catch-all partition
+--
+ALTER TABLE `measurements`
+  PARTITION BY RANGE (`ts`) (
+    PARTITION `pmax` VALUES LESS THAN MAXVALUE
+  );
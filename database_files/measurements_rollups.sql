@@ -0,0 +1,58 @@
+--
+-- Rollup tables for `measurements` (storage_service keeps them up to date on every insert)
+-- Database: `smart_aquariums`
+--
+
+SET time_zone = "+00:00";
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `measurements_hourly`
+--
+
+CREATE TABLE IF NOT EXISTS `measurements_hourly` (
+  `device_id` varchar(64) NOT NULL,
+  `sensor` varchar(64) NOT NULL,
+  `bucket_ts` bigint(20) NOT NULL,
+  `cnt` bigint(20) NOT NULL,
+  `vmin` double NOT NULL,
+  `vmax` double NOT NULL,
+  `vsum` double NOT NULL,
+  PRIMARY KEY (`device_id`,`sensor`,`bucket_ts`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `measurements_daily`
+--
+
+CREATE TABLE IF NOT EXISTS `measurements_daily` (
+  `device_id` varchar(64) NOT NULL,
+  `sensor` varchar(64) NOT NULL,
+  `bucket_ts` bigint(20) NOT NULL,
+  `cnt` bigint(20) NOT NULL,
+  `vmin` double NOT NULL,
+  `vmax` double NOT NULL,
+  `vsum` double NOT NULL,
+  PRIMARY KEY (`device_id`,`sensor`,`bucket_ts`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Backfill from the raw rows already stored (safe to run again: buckets are recomputed)
+--
+
+INSERT INTO `measurements_hourly` (`device_id`, `sensor`, `bucket_ts`, `cnt`, `vmin`, `vmax`, `vsum`)
+SELECT `device_id`, `sensor`, `ts` - MOD(`ts`, 3600), COUNT(*), MIN(`value`), MAX(`value`), SUM(`value`)
+FROM `measurements`
+GROUP BY `device_id`, `sensor`, `ts` - MOD(`ts`, 3600)
+ON DUPLICATE KEY UPDATE `cnt` = VALUES(`cnt`), `vmin` = VALUES(`vmin`), `vmax` = VALUES(`vmax`), `vsum` = VALUES(`vsum`);
+
+INSERT INTO `measurements_daily` (`device_id`, `sensor`, `bucket_ts`, `cnt`, `vmin`, `vmax`, `vsum`)
+SELECT `device_id`, `sensor`, `ts` - MOD(`ts`, 86400), COUNT(*), MIN(`value`), MAX(`value`), SUM(`value`)
+FROM `measurements`
+GROUP BY `device_id`, `sensor`, `ts` - MOD(`ts`, 86400)
+ON DUPLICATE KEY UPDATE `cnt` = VALUES(`cnt`), `vmin` = VALUES(`vmin`), `vmax` = VALUES(`vmax`), `vsum` = VALUES(`vsum`);
@@ -0,0 +1,26 @@
+--
+-- Wide storage layout for storage_service ("layout": "wide" in storage_service/config.json)
+-- Database: `smart_aquariums`
+--
+-- One row per device and timestamp, all sensor values in a JSON object:
+--   data = {"temperature": 27.4, "nitrate": 18.2, "turbidity": 8.0, "leakage": 0.0}
+-- Existing rows of `measurements` can be copied with storage_service/migrate_layout.py
+--
+
+SET time_zone = "+00:00";
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `measurements_wide`
+--
+
+CREATE TABLE IF NOT EXISTS `measurements_wide` (
+  `device_id` varchar(64) NOT NULL,
+  `ts` bigint(20) NOT NULL,
+  `data` longtext CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL CHECK (json_valid(`data`)),
+  PRIMARY KEY (`device_id`,`ts`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+  PARTITION BY RANGE (`ts`) (
+    PARTITION `pmax` VALUES LESS THAN MAXVALUE
+  );
@@ -1,6 +1,9 @@
 import json
 import requests
 
+from service_registry import ServiceRegistry
+from service_discovery import ServiceDiscovery
+
 # create a flat list of sensors and actuators dictionaries [{},{},{},...]
 def _build_resources(config):
     resources = []
@@ -72,11 +75,13 @@ def register_device_connector(config, config_path="config.json"):
         }
     }
 
-    try:
-        r = requests.post(f"{base_url}/services/register", json=svc_payload, timeout=5)
-        print("[CATALOGUE] Service register:", r.status_code, r.text)
-    except Exception as e:
-        print("[CATALOGUE] Service register failed:", e)
+    # heartbeats keep the entry alive in the catalogue
+    registry = ServiceRegistry(cat_host, cat_port)
+    registry.register(**svc_payload)
+    registry.start_heartbeat()
+
+    # ThingSpeak adaptor instances, resolved once and balanced per call
+    discovery = ServiceDiscovery(base_url)
 
     # ---------- helpers ----------
     def do_register():
@@ -107,6 +112,17 @@ def register_device_connector(config, config_path="config.json"):
             return {"_not_found": True}
         return None
 
+    def notify_thingspeak(device_id):
+        try:
+            r2 = discovery.request(
+                "thingspeak_adaptor", "POST", "/channels/create",
+                json={"device_id": device_id, "device_label": device_label},
+                timeout=8
+            )
+            print("[THINGSPEAK] channel create:", r2.status_code, r2.text)
+        except Exception as e:
+            print("[THINGSPEAK] channel create failed:", e)
+
     # ---------- 2) Device + resources ----------
     device_id = config.get("device_id")
 
@@ -135,21 +151,7 @@ def register_device_connector(config, config_path="config.json"):
         upd = do_update(device_id)
 
         # ----  notify ThingSpeak adaptor  to create channel  ----
-        s = requests.get(f"{base_url}/services/thingspeak_adaptor", timeout=5) #/ get the url of thingspeak from catalogue 
-        print("[THINGSPEAK] resolve:", s.status_code, s.text)
-        if s.status_code == 200:
-            data = s.json() or {}
-            ts_url = data.get("service").get("url") 
-
-            if ts_url:
-                
-                ts_url = ts_url.rstrip("/")
-                r2 = requests.post(
-                    ts_url + "/channels/create",
-                    json={"device_id": device_id, "device_label": device_label},
-                    timeout=8
-                )
-                print("[THINGSPEAK] channel create:", r2.status_code, r2.text)
+        notify_thingspeak(device_id)
 
         # If catalogue restarted and forgot the device_id, re-register then update again
         if upd and upd.get("_not_found"):
@@ -171,19 +173,7 @@ def register_device_connector(config, config_path="config.json"):
             do_update(device_id)
 
             # notify again with the NEW device_id
-            s = requests.get(f"{base_url}/services/thingspeak_adaptor", timeout=5)
-            print("[THINGSPEAK] resolve:", s.status_code, s.text)
-            if s.status_code == 200:
-                data = s.json() or {}
-                ts_url = data.get("service").get("url") # ts_url = ThingSpeak URL 
-                if ts_url:
-                    ts_url = ts_url.rstrip("/")
-                    r2 = requests.post(
-                        ts_url + "/channels/create",
-                        json={"device_id": device_id, "device_label": device_label},
-                        timeout=8
-                    )
-                    print("[THINGSPEAK] channel create:", r2.status_code, r2.text)
+            notify_thingspeak(device_id)
 
         return config
 
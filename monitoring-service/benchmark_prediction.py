@@ -0,0 +1,62 @@
+import argparse
+import json
+import random
+import time
+
+import requests
+
+from local_model import LocalPredictor
+
+
+# Latency of one prediction: embedded model (LocalPredictor) vs remote POST /predict
+#   python benchmark_prediction.py --url http://localhost:8092 --n 2000
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summary(samples_ms):
+    return {
+        "n": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 0.50), 4),
+        "p95_ms": round(percentile(samples_ms, 0.95), 4),
+        "p99_ms": round(percentile(samples_ms, 0.99), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local vs remote prediction")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--url", help="prediction service base url (remote path is skipped if missing)")
+    parser.add_argument("--n", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        cfg = json.load(f)
+
+    samples = [(random.uniform(0, 100), random.uniform(0, 100)) for _ in range(args.n)]
+    results = {}
+
+    local = LocalPredictor(cfg.get("local_model", {}).get("path", "../predict_service/water_quality_model.pkl"))
+    if local.version:
+        times = []
+        for nitrate, turbidity in samples:
+            t0 = time.perf_counter()
+            local.predict(nitrate, turbidity)
+            times.append((time.perf_counter() - t0) * 1000.0)
+        results["local"] = summary(times)
+
+    if args.url:
+        session = requests.Session()
+        times = []
+        for nitrate, turbidity in samples:
+            t0 = time.perf_counter()
+            session.post(f"{args.url.rstrip('/')}/predict", json={"nitrate": nitrate, "turbidity": turbidity}, timeout=4)
+            times.append((time.perf_counter() - t0) * 1000.0)
+        results["remote"] = summary(times)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import json
+import random
+import time
+
+from rule_table import RuleTable
+
+
+# Throughput of threshold checks: per-message loop over the thresholds dict vs RuleTable micro-batches
+#   python benchmark_rules.py --devices 10000 --messages 200000 --batch 64
+SENSORS = ["temperature", "ph", "nitrate", "turbidity", "oxygen", "ammonia", "salinity", "level"]
+
+
+def make_fleet(n_devices, rng):
+    fleet = {}
+    for d in range(n_devices):
+        fleet[f"dev-{d}"] = {
+            s: {"min": rng.uniform(0, 20), "max": rng.uniform(80, 100)}
+            for s in rng.sample(SENSORS, rng.randint(3, len(SENSORS)))
+        }
+    return fleet
+
+
+def make_messages(fleet, n, rng):
+    ids = list(fleet)
+    return [(rng.choice(ids), {s: rng.uniform(0, 100) for s in SENSORS}) for _ in range(n)]
+
+
+# what process_message did before the rule table (it appended an alert per violation,
+# so the violations are collected here too, like RuleTable.evaluate returns them)
+def loop_check(fleet, messages):
+    violations = []
+    for i, (device_id, data) in enumerate(messages):
+        for sensor, rule in fleet[device_id].items():
+            val = data.get(sensor)
+            if val is not None and (val < rule["min"] or val > rule["max"]):
+                violations.append((i, sensor, val))
+    return violations
+
+
+def table_check(table, messages, batch):
+    violations = []
+    for i in range(0, len(messages), batch):
+        violations += [(i + j, sensor, val) for j, sensor, val in table.evaluate(messages[i:i + batch])]
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark threshold evaluation")
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8, 16, 64, 256])
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    fleet = make_fleet(args.devices, rng)
+    messages = make_messages(fleet, args.messages, rng)
+
+    table = RuleTable()
+    t0 = time.perf_counter()
+    for device_id, thresholds in fleet.items():
+        table.set_device(device_id, thresholds)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    expected = loop_check(fleet, messages)
+    results = {
+        "devices": args.devices,
+        "messages": args.messages,
+        "table_build_ms": round(build_s * 1000.0, 1),
+        "set_device_us": round(build_s / args.devices * 1e6, 2),  # one incremental update
+        "loop_msgs_per_sec": round(args.messages / (time.perf_counter() - t0)),
+    }
+
+    for batch in args.batch:
+        t0 = time.perf_counter()
+        found = table_check(table, messages, batch)
+        results[f"table_batch{batch}_msgs_per_sec"] = round(args.messages / (time.perf_counter() - t0))
+        assert sorted(found) == sorted(expected), f"batch {batch}: {len(found)} violations, loop found {len(expected)}"
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
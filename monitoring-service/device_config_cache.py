@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+# --------------------------------------------------
+# Device thresholds cache
+# --------------------------------------------------
+# Warmed with one bulk request at startup (warm) and kept up to date by the catalogue's
+# retained config events (aquarium/<device_id>/config, see on_config_event);
+# the TTL is only a safety net for a lost event.
+# - stale-while-revalidate: an expired entry is still served while a background thread refetches it
+# - single-flight: concurrent misses of one device wait for a single /devices/<id> request
+# - negative caching: unknown devices (and failed fetches) are remembered for negative_ttl_seconds
+# - at most max_size devices, least recently used evicted first (on_evict frees its rules)
+# Every entry carries the device config version, so an older fetch / event never overwrites a newer one.
+class DeviceConfigCache:
+    def __init__(self, catalogue_base_url, ttl_seconds, on_update=None, on_evict=None,
+                 max_size=100000, negative_ttl_seconds=60, refresh_workers=4, timeout=4):
+        self.base = catalogue_base_url.rstrip("/")
+        self.ttl = float(ttl_seconds)
+        self.negative_ttl = float(negative_ttl_seconds)
+        self.max_size = int(max_size)
+        self.timeout = timeout
+        self.on_update = on_update # called with (device_id, thresholds) after every change (RuleTable.set_device)
+        self.on_evict = on_evict # called with device_id when a device leaves the cache (RuleTable.remove_device)
+
+        self.cache = OrderedDict()   # device_id -> {"expires": monotonic, "version": int, "thresholds": {...}, "missing": bool}
+        self._inflight = {}  # device_id -> Event set when its fetch is done
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=int(refresh_workers), thread_name_prefix="config-refresh")
+
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "fetches": 0,
+            "fetch_errors": 0,
+            "evictions": 0,
+            "events": 0,
+            "stale_ignored": 0,
+        }
+
+    def get_thresholds(self, device_id):
+        with self._lock:
+            entry = self.cache.get(device_id)
+            if entry is not None:
+                self.cache.move_to_end(device_id)
+                if entry["expires"] < time.monotonic() and device_id not in self._inflight:
+                    # expired: serve it anyway, refetch in the background
+                    self._inflight[device_id] = threading.Event()
+                    self._refresher.submit(self._fetch_and_store, device_id)
+                    self.stats["stale_hits"] += 1
+                else:
+                    self.stats["negative_hits" if entry["missing"] else "hits"] += 1
+                return entry["thresholds"]
+
+            self.stats["misses"] += 1
+            done = self._inflight.get(device_id)
+            leader = done is None
+            if leader:
+                done = self._inflight[device_id] = threading.Event()
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            return self._fetch_and_store(device_id)
+
+        # another worker is fetching this device
+        done.wait(self.timeout + 1)
+        with self._lock:
+            entry = self.cache.get(device_id)
+        return entry["thresholds"] if entry else {}
+
+    def _fetch_and_store(self, device_id):
+        try:
+            thresholds, version, missing = self.fetch_from_catalogue(device_id)
+            with self._lock:
+                self.stats["fetches"] += 1
+                if thresholds is None:
+                    self.stats["fetch_errors"] += 1
+                    entry = self.cache.get(device_id)
+                    if entry is not None:
+                        # catalogue unreachable: keep serving what we have, retry later
+                        entry["expires"] = time.monotonic() + self.negative_ttl
+                        return entry["thresholds"]
+                    thresholds, missing = {}, True
+                return self._store(device_id, thresholds, version, missing)
+        finally:
+            with self._lock:
+                self._inflight.pop(device_id).set()
+
+    # whole fleet with one GET /devices?fields=resources (at startup) -> number of devices cached
+    def warm(self):
+        r = requests.get(f"{self.base}/devices", params={"fields": "resources"}, timeout=30)
+        r.raise_for_status()
+        devices = r.json().get("devices", [])
+
+        with self._lock:
+            for device in devices:
+                thresholds = parse_thresholds(device.get("resources"))
+                self._store(str(device["device_id"]), thresholds or {}, int(device.get("version", 0)), False)
+        return len(devices)
+
+    # MQTT callback: retained config event published by the catalogue when thresholds change
+    def on_config_event(self, topic, payload):
+        try:
+            data = json.loads(payload)
+            device_id = str(data.get("device_id") or topic.split("/")[1])
+            thresholds = parse_thresholds(data.get("resources"))
+        except Exception as e:
+            print(f"[RESOURCE] invalid config event on {topic} -> {e}")
+            return
+
+        with self._lock:
+            self.stats["events"] += 1
+            self._store(device_id, thresholds or {}, int(data.get("version", 0)), False)
+
+    # caller holds self._lock
+    def _store(self, device_id, thresholds, version, missing):
+        now = time.monotonic()
+        entry = self.cache.get(device_id)
+        if entry and not entry["missing"] and version < entry["version"]:
+            self.stats["stale_ignored"] += 1 # a newer config arrived meanwhile: keep it, just restart its TTL
+            entry["expires"] = now + self.ttl
+            return entry["thresholds"]
+
+        self.cache[device_id] = {
+            "expires": now + (self.negative_ttl if missing else self.ttl),
+            "version": version,
+            "thresholds": thresholds,
+            "missing": missing,
+        }
+        self.cache.move_to_end(device_id)
+        while len(self.cache) > self.max_size:
+            evicted, _ = self.cache.popitem(last=False)
+            self.stats["evictions"] += 1
+            if self.on_evict:
+                self.on_evict(evicted)
+
+        if self.on_update:
+            self.on_update(device_id, thresholds)
+        return thresholds
+
+    # -> (thresholds, version, missing); thresholds is None when the catalogue could not be asked
+    def fetch_from_catalogue(self, device_id):
+        try:
+            r = requests.get(f"{self.base}/devices/{device_id}", timeout=self.timeout)
+            if r.status_code == 404:
+                return {}, 0, True # unknown device
+            data = r.json()
+            device = data.get("device")
+            thresholds = parse_thresholds(device.get("resources")) if device else None
+            if thresholds is None:
+                return {}, 0, True
+            return thresholds, int(device.get("version", 0)), False
+
+        except Exception as e:
+            print(f"[RESOURCE] fetch error: {e}")
+            return None, 0, False
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["devices"] = len(self.cache)
+            out["inflight"] = len(self._inflight)
+        return out
+
+
+# resources of a device (catalogue format) -> {sensor: {"min": float, "max": float}}, None if not a list
+def parse_thresholds(resources):
+    if not isinstance(resources, list):
+        return None
+
+    out = {}
+    for res in resources:
+        if res.get("kind") != "sensor":
+            continue
+
+        thr = res.get("threshold")
+        if not thr:
+            continue
+
+        mn = thr.get("min")
+        mx = thr.get("max")
+        if mn is None or mx is None:
+            continue
+
+        out[res["name"]] = {
+            "min": float(mn),
+            "max": float(mx)
+        }
+
+    return out
@@ -0,0 +1,94 @@
+import json
+import os
+import pickle
+import threading
+import time
+
+
+# --------------------------------------------------
+# Embedded prediction engine
+# --------------------------------------------------
+# Loads the current version of predict_service's model registry (<dir>/CURRENT -> <dir>/vN/model.pkl + meta.json)
+# and classifies in-process. CURRENT is checked at most every `reload_check_sec`
+# and a new version is loaded and swapped in while predictions keep running on the old one.
+# predict() returns None when no model is available -> caller falls back to the remote service.
+class LocalPredictor:
+    def __init__(self, path, reload_check_sec=10):
+        self.path = path  # registry directory
+        self.reload_check = float(reload_check_sec)
+
+        self._artifact = None  # replaced as a whole, never modified
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+        self.stats = {"predictions": 0, "reloads": 0, "load_errors": 0}
+        self._maybe_reload()
+
+    @property
+    def version(self):
+        artifact = self._artifact
+        return artifact["version"] if artifact else None
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            self._next_check = now + self.reload_check
+            current = os.path.join(self.path, "CURRENT")
+            mtime = os.path.getmtime(current)
+            if mtime == self._mtime:
+                return
+
+            with open(current, "r") as f:
+                version = f.read().strip()
+            if self._artifact is None or version != self._artifact["version"]:
+                self._artifact = self._load(version)
+                self.stats["reloads"] += 1
+                print(f"[MODEL] loaded local model {version} from {self.path}")
+            self._mtime = mtime
+        except Exception as e:
+            # missing file, or sklearn not installed here: keep the previous model (or none)
+            self.stats["load_errors"] += 1
+            if self._artifact is None:
+                print(f"[MODEL] local model unavailable: {e}")
+        finally:
+            self._lock.release()
+
+    def _load(self, version):
+        version_dir = os.path.join(self.path, version)
+        with open(os.path.join(version_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+        with open(os.path.join(version_dir, "model.pkl"), "rb") as f:
+            model = pickle.load(f)
+
+        features = meta.get("features", ["nitrate", "turbidity"])
+        return {
+            "version": version,
+            "model": model,
+            "features": features,
+            "scales": [float(meta.get("scaler", {}).get(f, 1.0)) for f in features],
+            "labels": {str(k): v for k, v in (meta.get("labels") or {}).items()},
+        }
+
+    def predict(self, nitrate, turbidity):
+        self._maybe_reload()
+
+        artifact = self._artifact
+        if artifact is None:
+            return None
+
+        values = {"nitrate": float(nitrate), "turbidity": float(turbidity)}
+        x = [values[f] / scale for f, scale in zip(artifact["features"], artifact["scales"])]
+        raw = str(artifact["model"].predict([x])[0])
+        label = artifact["labels"].get(raw, raw)
+        self.stats["predictions"] += 1
+
+        return {"status": "ok", "water_quality": label, "version": artifact["version"]}
+
+    def snapshot(self):
+        out = dict(self.stats)
+        out["version"] = self.version
+        return out
@@ -1,74 +1,21 @@
 import json
 import time
-import requests
 
 from mqtt_client import MQTTClient
 from service_registry import ServiceRegistry
+from service_discovery import ServiceDiscovery
+from worker_pool import WorkerPool
+from prediction_batcher import PredictionBatcher
+from local_model import LocalPredictor
+from prediction_cache import PredictionCache
+from rule_table import RuleTable
+from device_config_cache import DeviceConfigCache
 
 
 def now_ts():
     return int(time.time())
 
 
-# --------------------------------------------------
-# Device thresholds cache 
-# --------------------------------------------------
-class DeviceConfigCache:
-    def __init__(self, catalogue_base_url, ttl_seconds):
-        self.base = catalogue_base_url.rstrip("/")
-        self.ttl = ttl_seconds
-        self.cache = {}   # device_id -> {"ts": int, "thresholds": {...}}
-
-    def get_thresholds(self, device_id):
-        entry = self.cache.get(device_id)
-        if entry and now_ts() - entry["ts"] <= self.ttl: # if there is entry for device_id and ttl is valid return thresholds
-            return entry["thresholds"]
-
-        thresholds = self.fetch_from_catalogue(device_id) 
-        if thresholds is None:
-            thresholds = {}
-
-        self.cache[device_id] = { 
-            "ts": now_ts(),
-            "thresholds": thresholds
-        }
-        return thresholds
-
-    def fetch_from_catalogue(self, device_id):
-        try:
-            r = requests.get(f"{self.base}/devices/{device_id}", timeout=4)
-            data = r.json()
-            device = data.get("device")
-            resources = device.get("resources") if device else None
-            if not isinstance(resources, list):
-                return None
-
-            out = {}
-            for res in resources:
-                if res.get("kind") != "sensor":
-                    continue
-
-                thr = res.get("threshold")
-                if not thr:
-                    continue
-
-                mn = thr.get("min")
-                mx = thr.get("max")
-                if mn is None or mx is None:
-                    continue
-
-                out[res["name"]] = {
-                    "min": float(mn),
-                    "max": float(mx)
-                }
-
-            return out
-
-        except Exception as e:
-            print(f"[RESOURCE] fetch error: {e}")
-            return None
-
-
 # --------------------------------------------------
 # Monitoring Service
 # --------------------------------------------------
@@ -90,35 +37,114 @@ class MonitoringService:
             client_id=self.name
         )
 
-        self.cache = DeviceConfigCache(self.catalogue_base_url,cfg.get("cache_ttl_seconds", 120))
+        # thresholds of all devices compiled into arrays, one row rewritten per cache refresh
+        self.rules = RuleTable()
+        device_cache_cfg = cfg.get("device_cache", {})
+        self.cache = DeviceConfigCache(
+            self.catalogue_base_url,
+            cfg.get("cache_ttl_seconds", 3600),
+            on_update=self.rules.set_device,
+            on_evict=self.rules.remove_device,
+            max_size=int(device_cache_cfg.get("max_size", 100000)),
+            negative_ttl_seconds=int(device_cache_cfg.get("negative_ttl_seconds", 60)),
+            refresh_workers=int(device_cache_cfg.get("refresh_workers", 4)),
+        )
 
         self.pump_cooldown = int(cfg.get("pump_cooldown_sec", 180 * 60)) # after publish water_pump on => prevent publishing for 3 hours 
         self.last_pump_ts = {} # store the last time water_pump started for each device_id self.last_pump_ts[device_id]
 
-        # ---- Get prediction service URL ----
-        self.predict_base_url = None
-        try:
-            r = requests.get(f"{self.catalogue_base_url}/services/prediction_service",timeout=4)
-            if r.status_code == 200:
-                self.predict_base_url = r.json()["service"]["url"]
-            else:
-                print("[MON] prediction service not found")
-        except Exception as e:
-            print(f"[MON] catalogue unreachable: {e}")
+        # messages are processed by a worker pool, so a slow catalogue / prediction call
+        # does not block the MQTT network thread (per-device order is preserved)
+        # each worker takes up to worker_batch waiting messages and checks their thresholds in one go
+        self.workers = WorkerPool(
+            self.process_batch,
+            workers=int(cfg.get("workers", 4)),
+            queue_size=int(cfg.get("queue_size", 1000)),
+            name="mon-worker",
+            max_batch=int(cfg.get("worker_batch", 64)),
+        )
+        self.stats_interval = int(cfg.get("stats_interval_sec", 60))
+
+        # ---- Prediction service instances (resolved through the catalogue, balanced per call) ----
+        discovery_cfg = cfg.get("discovery", {})
+        self.discovery = ServiceDiscovery(
+            self.catalogue_base_url,
+            strategy=discovery_cfg.get("strategy", "least_outstanding"),
+            ttl_sec=int(discovery_cfg.get("ttl_sec", 15)),
+            failure_cooldown_sec=int(discovery_cfg.get("failure_cooldown_sec", 10)),
+        )
+        self.predict_service_name = cfg.get("prediction_service_name", "prediction_service")
+        if not self.discovery.instances(self.predict_service_name):
+            print("[MON] prediction service not found (looked up again on use)")
+
+        # embedded mode: classify in-process with the current model of predict_service's registry
+        self.local_model = None
+        local_cfg = cfg.get("local_model", {})
+        if local_cfg.get("enabled", False):
+            self.local_model = LocalPredictor(
+                local_cfg.get("path", "../predict_service/models"),
+                reload_check_sec=int(local_cfg.get("reload_check_sec", 10)),
+            )
+
+        # memoized predictions (features quantized, see PredictionCache)
+        self.prediction_cache = None
+        self.cached_model_version = None
+        cache_cfg = cfg.get("prediction_cache", {})
+        if cache_cfg.get("enabled", False):
+            self.prediction_cache = PredictionCache(
+                nitrate_scale=cfg.get("nitrate_scale", 100),
+                turbidity_scale=cfg.get("turbidity_scale", 100),
+                step=float(cache_cfg.get("quantization", 0.01)),
+                max_size=int(cache_cfg.get("max_size", 10000)),
+                ttl_sec=int(cache_cfg.get("ttl_sec", 300)),
+            )
+
+        # outstanding predictions of all workers are sent together to POST /predict/batch
+        # of one prediction service instance
+        batch_cfg = cfg.get("prediction_batch", {})
+        self.batcher = PredictionBatcher(
+            self.discovery,
+            self.predict_service_name,
+            max_batch=int(batch_cfg.get("max_batch", 64)),
+            max_wait_ms=int(batch_cfg.get("max_wait_ms", 5)),
+        )
 
 
     def start(self):
         registry = ServiceRegistry(self.catalog_host, self.catalog_port)
         registry.register(self.name, self.host, self.port)
+        registry.start_heartbeat()
+        self.discovery.start_watch() # prediction service instances follow the catalogue live
+
+        # thresholds of the whole fleet in one request instead of one per device
+        try:
+            print(f"[MON] warmed thresholds of {self.cache.warm()} devices")
+        except Exception as e:
+            print(f"[MON] threshold cache warm-up failed -> {e}")
 
+        self.workers.start()
         self.mqtt.connect()
+        self.mqtt.subscribe("aquarium/+/config", self.cache.on_config_event, qos=1) # retained -> current config of every device
         self.mqtt.subscribe("aquarium/+/sensors/agg", self.on_agg_sensors)
         print("[MON] Started")
 
+        last_stats = time.time()
         while True:
             time.sleep(1) # let thread of mqtt be a live 
 
+            if time.time() - last_stats >= self.stats_interval:
+                stats = {"workers": self.workers.snapshot(), "rules": self.rules.snapshot(), "device_config": self.cache.snapshot()}
+                stats["prediction_batches"] = self.batcher.snapshot()
+                stats["discovery"] = self.discovery.snapshot()
+                if self.local_model:
+                    stats["local_model"] = self.local_model.snapshot()
+                if self.prediction_cache:
+                    stats["prediction_cache"] = self.prediction_cache.snapshot()
+                print(f"[MON] stats {json.dumps(stats)}")
+                last_stats = time.time()
+
     #-- when a data of a device connector recived it will be called by call back on message
+    # runs on the MQTT thread: only parse and hand the message to a worker
     def on_agg_sensors(self, topic, payload):
         try:
             data = json.loads(payload)
@@ -126,37 +152,48 @@ class MonitoringService:
             return
 
         device_id = data.get("device_id") or topic.split("/")[1]
-        thresholds = self.cache.get_thresholds(device_id)
-
-        alerts = [] # store all alert as several dict in a list
-
-        # threshold checks
-        for sensor, rule in thresholds.items(): # loop over thresholds and check the value for the sensor
-            val = data.get(sensor)
-            if val is not None:
-                if val < rule["min"] or val > rule["max"]:
-                    alerts.append({
-                        "device_id": device_id,
-                        "level": "warning",
-                        "value":val,
-                        "message": f"{sensor} out of range - value : {val}",
-                        "ts": now_ts()
-                    })
-
-        # Prediction (nitrate + turbidity only)
-        nitrate = data.get("nitrate")
-        turbidity = data.get("turbidity")
-
-        if (self.predict_base_url and isinstance(nitrate, (int, float)) and isinstance(turbidity, (int, float))):
-            pred = self.call_prediction(nitrate, turbidity)
-            if pred and pred.get("water_quality") == "bad":
-                alerts.append({
-                    "device_id": device_id,
-                    "level": "danger",
-                    "message": "Bad water quality (prediction)",
-                    "ts": now_ts()
-                })
-                self.send_pump_command(device_id)
+        self.workers.submit(device_id, (device_id, data)) # dropped (and counted) when the worker queue is full
+
+    # runs on a worker thread, items: [(device_id, data), ...] in arrival order
+    def process_batch(self, items):
+        for device_id in {device_id for device_id, _ in items}:
+            self.cache.get_thresholds(device_id) # refetches expired devices -> RuleTable row updated
+
+        # threshold checks of the whole batch at once
+        alerts = [[] for _ in items] # alerts of each message
+        for i, sensor, val in self.rules.evaluate(items):
+            alerts[i].append({
+                "device_id": items[i][0],
+                "level": "warning",
+                "value":val,
+                "message": f"{sensor} out of range - value : {val}",
+                "ts": now_ts()
+            })
+
+        # predictions of the whole batch: cache / local model per message, the rest in one batcher submission
+        # (one flush wait per micro-batch instead of one per message)
+        pairs = [(data.get("nitrate"), data.get("turbidity")) for _, data in items]
+        predictable = [i for i, (n, t) in enumerate(pairs) if isinstance(n, (int, float)) and isinstance(t, (int, float))]
+        preds = [None] * len(items)
+        for i, pred in zip(predictable, self.predict_many([pairs[i] for i in predictable])):
+            preds[i] = pred
+
+        for (device_id, data), message_alerts, pred in zip(items, alerts, preds):
+            try:
+                self.process_message(device_id, message_alerts, pred)
+            except Exception as e:
+                print(f"[MON] processing of a message from {device_id} failed -> {e}")
+
+    # reaction to the prediction and publishing of one message (threshold alerts already in `alerts`)
+    def process_message(self, device_id, alerts, pred):
+        if pred and pred.get("water_quality") == "bad":
+            alerts.append({
+                "device_id": device_id,
+                "level": "danger",
+                "message": "Bad water quality (prediction)",
+                "ts": now_ts()
+            })
+            self.send_pump_command(device_id)
 
         #----- publish alerts -------------------
         for a in alerts:
@@ -164,18 +201,32 @@ class MonitoringService:
         
 
 
-    def call_prediction(self, nitrate, turbidity):
-        try:
-            r = requests.post(
-                f"{self.predict_base_url}/predict",
-                json={"nitrate": nitrate, "turbidity": turbidity},
-                timeout=4
-            )
-            if r.status_code == 200:
-                return r.json()
-        except Exception as e:
-            print(f"[MON] prediction error: {e}")
-        return None
+    # pairs: [(nitrate, turbidity), ...] -> [{"water_quality": ...} or None, ...] in the same order
+    # cache first, then the local model, the remote prediction service (one batch) for what is left
+    def predict_many(self, pairs):
+        # a reloaded local model invalidates what was cached
+        if self.prediction_cache and self.local_model and self.local_model.version != self.cached_model_version:
+            self.prediction_cache.clear()
+            self.cached_model_version = self.local_model.version
+
+        preds = [None] * len(pairs)
+        remote = [] # indexes of the pairs left for the prediction service
+        for i, (nitrate, turbidity) in enumerate(pairs):
+            pred = self.prediction_cache.get(nitrate, turbidity) if self.prediction_cache else None
+            if pred is None and self.local_model:
+                pred = self.local_model.predict(nitrate, turbidity)
+                if pred is not None and self.prediction_cache:
+                    self.prediction_cache.put(nitrate, turbidity, pred)
+            if pred is None:
+                remote.append(i)
+            preds[i] = pred
+
+        if remote:
+            for i, pred in zip(remote, self.batcher.predict_many([pairs[i] for i in remote])):
+                preds[i] = pred
+                if pred is not None and self.prediction_cache:
+                    self.prediction_cache.put(*pairs[i], pred)
+        return preds
 
     def send_pump_command(self, device_id):
         now = now_ts()
@@ -8,19 +8,27 @@ class MQTTClient:
         self.port = port
         self.client = mqtt.Client(client_id=client_id)
 
-        self._callback = None
+        self._subscriptions = {}  # topic pattern -> {"callback", "qos"}
 
+        self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
 
     def connect(self):
         self.client.connect(self.broker, self.port)
         self.client.loop_start()
 
+    def _on_connect(self, client, userdata, flags, rc):
+        # re-subscribe after reconnect (retained messages are delivered again)
+        for topic, sub in self._subscriptions.items():
+            self.client.subscribe(topic, qos=sub["qos"])
+
     def _on_message(self, client, userdata, msg):
-        if self._callback:
-            topic = msg.topic
-            payload = msg.payload.decode(errors="replace")
-            self._callback(topic, payload)
+        topic = msg.topic
+        payload = msg.payload.decode(errors="replace")
+
+        for pattern, sub in self._subscriptions.items():
+            if mqtt.topic_matches_sub(pattern, topic):
+                sub["callback"](topic, payload)
 
     def publish(self, topic, payload, qos=0):
         if isinstance(payload, dict):
@@ -28,5 +36,5 @@ class MQTTClient:
         self.client.publish(topic, payload, qos=qos)
 
     def subscribe(self, topic_pattern, callback, qos=0):
-        self._callback = callback
+        self._subscriptions[topic_pattern] = {"callback": callback, "qos": qos}
         self.client.subscribe(topic_pattern, qos=qos)
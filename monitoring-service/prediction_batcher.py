@@ -0,0 +1,102 @@
+import threading
+import time
+
+
+# --------------------------------------------------
+# Micro-batching of prediction requests
+# --------------------------------------------------
+# Worker threads call predict() / predict_many() and wait; a flusher thread collects the outstanding
+# samples and sends them in one POST /predict/batch when `max_batch` samples are waiting
+# or the oldest one waited `max_wait_ms`. Each batch goes to the instance of `service_name`
+# picked by the ServiceDiscovery (load balanced, next instance tried if one is down).
+class PredictionBatcher:
+    def __init__(self, discovery, service_name, max_batch=64, max_wait_ms=5, timeout=4):
+        self.discovery = discovery
+        self.service_name = service_name
+        self.max_batch = int(max_batch)
+        self.max_wait = float(max_wait_ms) / 1000.0
+        self.timeout = timeout
+
+        self._pending = []  # [(sample, slot, enqueued monotonic)] - slot = {"event": Event, "result": ...}
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="prediction-batcher", daemon=True)
+        self._thread.start()
+
+        self.stats = {"requests": 0, "batches": 0, "failed_batches": 0, "batch_size_max": 0}
+
+    # blocks the calling worker until its batch is answered -> {"water_quality": ...} or None
+    def predict(self, nitrate, turbidity):
+        return self.predict_many([(nitrate, turbidity)])[0]
+
+    # pairs: [(nitrate, turbidity), ...] of one worker micro-batch, queued together so they share
+    # the flush wait (and batches) -> [{"water_quality": ...} or None, ...] in the same order
+    def predict_many(self, pairs):
+        slots = [{"event": threading.Event(), "result": None} for _ in pairs]
+        with self._cond:
+            was_idle = not self._pending
+            now = time.monotonic()
+            self._pending += [
+                ({"nitrate": nitrate, "turbidity": turbidity}, slot, now)
+                for (nitrate, turbidity), slot in zip(pairs, slots)
+            ]
+            self.stats["requests"] += len(pairs)
+            if was_idle or len(self._pending) >= self.max_batch:
+                self._cond.notify()  # flusher idle (starts the max_wait clock) / batch full
+
+        deadline = time.monotonic() + self.timeout + self.max_wait + 1
+        for slot in slots:
+            slot["event"].wait(max(0.0, deadline - time.monotonic()))
+        return [slot["result"] for slot in slots]
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            while len(self._pending) < self.max_batch:
+                # deadline of the oldest sample (samples left behind by a full batch keep their own)
+                remaining = self._pending[0][2] + self.max_wait - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            labels = self._post([sample for sample, _, _ in batch])
+
+            with self._cond:
+                self.stats["batches"] += 1
+                self.stats["batch_size_max"] = max(self.stats["batch_size_max"], len(batch))
+                if labels is None:
+                    self.stats["failed_batches"] += 1
+
+            for i, (_, slot, _) in enumerate(batch):
+                if labels is not None:
+                    slot["result"] = {"status": "ok", "water_quality": labels[i]}
+                slot["event"].set()
+
+    def _post(self, samples):
+        try:
+            r = self.discovery.request(
+                self.service_name, "POST", "/predict/batch", json={"samples": samples}, timeout=self.timeout
+            )
+            if r.status_code == 200:
+                labels = r.json().get("water_quality")
+                if isinstance(labels, list) and len(labels) == len(samples):
+                    return labels
+            print(f"[MON] batch prediction failed: {r.status_code} {r.text}")
+        except Exception as e:
+            print(f"[MON] batch prediction error: {e}")
+        return None
+
+    def snapshot(self):
+        with self._cond:
+            out = dict(self.stats)
+            out["pending"] = len(self._pending)
+        out["batch_size_avg"] = out["requests"] / out["batches"] if out["batches"] else 0.0
+        return out
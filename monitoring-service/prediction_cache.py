@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# --------------------------------------------------
+# Prediction memoization
+# --------------------------------------------------
+# Keyed on the features normalized like PredictionService._norm and quantized to `step`
+# (step 0.01 on a scale of 100 -> nitrate / turbidity rounded to 1 unit).
+# Bigger step = more hits, less precise near the decision boundary.
+# LRU bounded to `max_size` entries, entries expire after `ttl_sec`.
+class PredictionCache:
+    def __init__(self, nitrate_scale=100, turbidity_scale=100, step=0.01, max_size=10000, ttl_sec=300):
+        self.nitrate_scale = float(nitrate_scale)
+        self.turbidity_scale = float(turbidity_scale)
+        self.step = float(step)
+        self.max_size = int(max_size)
+        self.ttl = float(ttl_sec)
+
+        self._entries = OrderedDict()  # key -> (expires_at, prediction)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def key(self, nitrate, turbidity):
+        return (
+            round(float(nitrate) / self.nitrate_scale / self.step),
+            round(float(turbidity) / self.turbidity_scale / self.step),
+        )
+
+    def get(self, nitrate, turbidity):
+        key = self.key(nitrate, turbidity)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, nitrate, turbidity, prediction):
+        key = self.key(nitrate, turbidity)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, prediction)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # the model changed -> cached labels may be wrong
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["size"] = len(self._entries)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = out["hits"] / lookups if lookups else 0.0
+        return out
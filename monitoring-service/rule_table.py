@@ -0,0 +1,148 @@
+import threading
+from itertools import chain, repeat
+from operator import attrgetter, itemgetter
+
+import numpy as np
+
+
+# --------------------------------------------------
+# Compiled threshold rules of all devices
+# --------------------------------------------------
+# mins[slot, col] / maxs[slot, col] hold the thresholds of device `slot` for sensor `col`
+# (-inf / +inf where a device has no rule for a sensor, so it never fires).
+# Slots and columns are assigned on first sight and the arrays grow by doubling.
+# set_device() rewrites one row when DeviceConfigCache (re)fetches a device; remove_device() clears
+# the row of a device evicted from the cache and keeps the slot for the next new device;
+# evaluate() checks a whole micro-batch of messages with two vectorized comparisons; the matrices
+# are filled by C-level iteration (map / np.array), so the per-message Python work is a few dict
+# lookups. Below SMALL_BATCH messages the fixed numpy cost is higher than a plain loop over the
+# thresholds, so those are checked one by one.
+NUMBERS = (int, float)
+
+
+class RuleTable:
+    SMALL_BATCH = 8
+
+    def __init__(self, devices=64, sensors=8):
+        self.rules = {}  # device_id -> thresholds, for the small batch loop
+        self.slots = {}  # device_id -> row
+        self._free = []  # rows of removed devices, reused before the table grows
+        self.columns = {}  # sensor name -> column
+        self.names = ()  # sensor names in column order (replaced, never modified)
+        self.mins = np.full((int(devices), int(sensors)), -np.inf)
+        self.maxs = np.full((int(devices), int(sensors)), np.inf)
+
+        self._lock = threading.Lock()
+        self.stats = {"updates": 0, "removals": 0, "batches": 0, "messages": 0, "violations": 0}
+
+    def _grow(self, rows, cols):
+        old_rows, old_cols = self.mins.shape
+        if rows <= old_rows and cols <= old_cols:
+            return
+        rows = max(rows, old_rows * 2 if rows > old_rows else old_rows)
+        cols = max(cols, old_cols * 2 if cols > old_cols else old_cols)
+
+        mins = np.full((rows, cols), -np.inf)
+        maxs = np.full((rows, cols), np.inf)
+        mins[:old_rows, :old_cols] = self.mins
+        maxs[:old_rows, :old_cols] = self.maxs
+        self.mins, self.maxs = mins, maxs
+
+    # thresholds: {"nitrate": {"min": .., "max": ..}, ...} - replaces all rules of the device
+    def set_device(self, device_id, thresholds):
+        with self._lock:
+            slot = self.slots.get(device_id)
+            if slot is None:
+                slot = self.slots[device_id] = self._free.pop() if self._free else len(self.slots)
+            for sensor in thresholds:
+                if sensor not in self.columns:
+                    self.columns[sensor] = len(self.columns)
+                    self.names = self.names + (sensor,)
+            self._grow(len(self.slots) + len(self._free), len(self.columns))
+            self.rules[device_id] = thresholds
+
+            self.mins[slot] = -np.inf
+            self.maxs[slot] = np.inf
+            for sensor, rule in thresholds.items():
+                col = self.columns[sensor]
+                self.mins[slot, col] = rule["min"]
+                self.maxs[slot, col] = rule["max"]
+            self.stats["updates"] += 1
+
+    # device evicted from DeviceConfigCache: no rules until it is fetched again, its row is reused
+    def remove_device(self, device_id):
+        with self._lock:
+            slot = self.slots.pop(device_id, None)
+            if slot is None:
+                return
+            del self.rules[device_id]
+            self.mins[slot] = -np.inf
+            self.maxs[slot] = np.inf
+            self._free.append(slot)
+            self.stats["removals"] += 1
+
+    # batch: [(device_id, data), ...] -> [(index in batch, sensor, value), ...] for every value out of range
+    def evaluate(self, batch):
+        if len(batch) < self.SMALL_BATCH:
+            return self._evaluate_loop(batch)
+
+        names = self.names
+        values = self._values(batch, names)  # NaN where a message has no value (compares False)
+
+        with self._lock:
+            device_ids = map(itemgetter(0), batch)
+            slots = np.fromiter(map(self.slots.get, device_ids, repeat(-1)), dtype=np.intp, count=len(batch))
+            rows = np.maximum(slots, 0)
+            out_of_range = (values < self.mins[rows, :len(names)]) | (values > self.maxs[rows, :len(names)])
+            out_of_range[slots < 0] = False  # device never fetched -> no rules
+
+            hits, cols = np.nonzero(out_of_range)
+            self.stats["batches"] += 1
+            self.stats["messages"] += len(batch)
+            self.stats["violations"] += len(hits)
+
+        hit_names = map(names.__getitem__, cols.tolist())
+        return [(i, name, batch[i][1][name]) for i, name in zip(hits.tolist(), hit_names)]
+
+    # same result as evaluate, one message at a time
+    def _evaluate_loop(self, batch):
+        out = []
+        with self._lock:
+            rules = self.rules
+            for i, (device_id, data) in enumerate(batch):
+                device_rules = rules.get(device_id)
+                if not device_rules:
+                    continue
+                for sensor, rule in device_rules.items():
+                    val = data.get(sensor)
+                    if val is None or not isinstance(val, NUMBERS):
+                        continue
+                    if val < rule["min"] or val > rule["max"]:
+                        out.append((i, sensor, val))
+            self.stats["batches"] += 1
+            self.stats["messages"] += len(batch)
+            self.stats["violations"] += len(out)
+        return out
+
+    # messages x sensor columns matrix
+    @staticmethod
+    def _values(batch, names):
+        n, m = len(batch), len(names)
+        # data.get(name, nan) for every message and column, without a Python loop per message
+        getters = map(attrgetter("get"), map(itemgetter(1), batch))
+        cells = np.array(list(chain.from_iterable(map(map, getters, repeat(names), repeat((np.nan,) * m)))))
+        if cells.dtype.kind in "fiub":  # numbers only (a string or None gives a str / object array)
+            return cells.astype(float, copy=False).reshape(n, m)
+        # something else than a number somewhere (None, "12", ...): only numbers are checked,
+        # like _evaluate_loop does (converting "12" to 12.0 would check it on this path only)
+        return np.array([
+            [v if isinstance(v, NUMBERS) else None for v in map(data.get, names)] for _, data in batch
+        ], dtype=float).reshape(n, m)
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["devices"] = len(self.slots)
+            out["rows"] = len(self.slots) + len(self._free)
+            out["sensors"] = len(self.columns)
+        return out
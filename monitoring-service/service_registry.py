@@ -1,17 +1,28 @@
+import threading
+
 import requests
 
+
 class ServiceRegistry:
-    
+
     def __init__(self, catalog_host="localhost", catalog_port=8080):
         self.base_url = f"http://{catalog_host}:{catalog_port}"
+        self.payload = None
+        self._stop = threading.Event()
+        self._thread = None
 
-    def register(self, name, host, port):
+    # extra: optional registration fields, e.g. type, meta, weight (load balancing share of this
+    # instance, 0 = drained) or instance_id (default host:port; replicas of a service differ in it)
+    def register(self, name, host, port, **extra):
         url = f"{self.base_url}/services/register"
         payload = {
             "name": name,
             "host": host,
-            "port": port
+            "port": port,
+            **extra
         }
+        payload.setdefault("instance_id", f"{host}:{port}")
+        self.payload = payload
 
         try:
             r = requests.post(url, json=payload, timeout=4)
@@ -20,3 +31,37 @@ class ServiceRegistry:
         except Exception as e:
             print(f"[CATALOGUE] register failed -> {e}")
             return False
+
+    # POST /services/<name>/heartbeat -> True if the catalogue knows this instance
+    # (re-registers when the catalogue answers 404: entry expired or catalogue state lost)
+    def heartbeat(self):
+        name = self.payload["name"]
+        try:
+            r = requests.post(
+                f"{self.base_url}/services/{name}/heartbeat",
+                json={"instance_id": self.payload["instance_id"]},
+                timeout=2,
+            )
+            if r.status_code == 404:
+                print(f"[CATALOGUE] {name} unknown to the catalogue, registering again")
+                return self.register(**self.payload)
+            return r.status_code == 200
+        except Exception as e:
+            print(f"[CATALOGUE] heartbeat failed -> {e}")
+            return False
+
+    # heartbeat every interval_sec seconds in a daemon thread (call after register);
+    # the catalogue reports the instance down after 30 s without one and removes it after 10 min
+    def start_heartbeat(self, interval_sec=10):
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval_sec):
+                self.heartbeat()
+
+        self._thread = threading.Thread(target=loop, name="catalogue-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
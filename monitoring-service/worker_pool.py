@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+import zlib
+
+
+# --------------------------------------------------
+# Worker pool between the MQTT callback thread and message processing
+# --------------------------------------------------
+# Each worker has its own bounded queue. A message is routed by the hash of its key (device_id),
+# so all messages of one device are handled by the same worker in arrival order,
+# while different devices are processed concurrently.
+# submit() never blocks: when the queue of a worker is full the message is dropped and counted (backpressure).
+# The handler gets a micro-batch: the items waiting in the worker queue (at most max_batch), in arrival order.
+class WorkerPool:
+    def __init__(self, handler, workers=4, queue_size=1000, name="worker", max_batch=1):
+        self.handler = handler
+        self.max_batch = int(max_batch)
+        self.queues = [queue.Queue(maxsize=int(queue_size)) for _ in range(int(workers))]
+        self.threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"{name}-{i}", daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+
+        self._lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "processed": 0,
+            "dropped": 0,
+            "errors": 0,
+            "batches": 0,
+            "queue_wait_ms_max": 0.0,
+            "queue_wait_ms_total": 0.0,
+            "handle_ms_max": 0.0,
+            "handle_ms_total": 0.0,
+        }
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+
+    # called from the MQTT thread
+    def submit(self, key, item):
+        q = self.queues[zlib.crc32(str(key).encode("utf-8")) % len(self.queues)]
+        try:
+            q.put_nowait((time.monotonic(), item))
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+
+        with self._lock:
+            self.stats["submitted"] += 1
+        return True
+
+    # blocks for the first item, then takes what is already waiting
+    def _next_batch(self, q):
+        batch = [q.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, q):
+        while True:
+            batch = self._next_batch(q)
+            start = time.monotonic()
+            try:
+                self.handler([item for _, item in batch])
+                failed = False
+            except Exception as e:
+                print(f"[WORKER] handler error: {e}")
+                failed = True
+            end = time.monotonic()
+
+            wait_ms = (start - batch[0][0]) * 1000.0  # oldest item of the batch
+            handle_ms = (end - start) * 1000.0
+            with self._lock:
+                self.stats["processed"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["errors"] += int(failed)
+                self.stats["queue_wait_ms_max"] = max(self.stats["queue_wait_ms_max"], wait_ms)
+                self.stats["queue_wait_ms_total"] += wait_ms
+                self.stats["handle_ms_max"] = max(self.stats["handle_ms_max"], handle_ms)
+                self.stats["handle_ms_total"] += handle_ms
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+        depths = [q.qsize() for q in self.queues]
+        out["queue_depth"] = sum(depths)
+        out["queue_depth_max_worker"] = max(depths)
+        out["queue_capacity"] = sum(q.maxsize for q in self.queues)
+        if out["processed"]:
+            out["queue_wait_ms_avg"] = out["queue_wait_ms_total"] / out["batches"]
+            out["handle_ms_avg"] = out["handle_ms_total"] / out["batches"]
+            out["batch_size_avg"] = out["processed"] / out["batches"]
+        return out
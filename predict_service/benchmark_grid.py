@@ -0,0 +1,58 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from main import fit_demo_model
+from model_registry import LoadedModel
+
+
+# Microbenchmark of the compiled decision grid vs the exact KNN model (demo model)
+#   python benchmark_grid.py --n 20000 --resolution 512
+def per_call_us(fn, samples):
+    t0 = time.perf_counter()
+    for x in samples:
+        fn(x)
+    return (time.perf_counter() - t0) / len(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decision grid vs exact model")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--resolution", type=int, default=512)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        cfg = json.load(f)
+
+    grid_cfg = dict(cfg.get("decision_grid", {}), enabled=True, resolution=args.resolution, min_accuracy=0)
+    t0 = time.perf_counter()
+    loaded = LoadedModel("demo", fit_demo_model(cfg.get("k", 3)), {}, grid_cfg)
+    build_ms = (time.perf_counter() - t0) * 1000.0
+
+    model, grid = loaded.model, loaded.grid
+    X = np.random.default_rng(1).uniform(0, grid.max_norm, size=(args.n, 2))
+    single = X[:min(args.n, 2000)]
+
+    results = {
+        "resolution": grid.resolution,
+        "build_ms": round(build_ms, 1),
+        "agreement": grid.accuracy(model, samples=args.n),
+        "single_exact_us": round(per_call_us(lambda x: model.predict([x]), single), 2),
+        "single_grid_us": round(per_call_us(lambda x: grid.lookup(x[0], x[1]), single), 2),
+    }
+
+    t0 = time.perf_counter()
+    model.predict(X)
+    results["batch_exact_us_per_sample"] = round((time.perf_counter() - t0) / args.n * 1e6, 3)
+    t0 = time.perf_counter()
+    grid.lookup_many(X)
+    results["batch_grid_us_per_sample"] = round((time.perf_counter() - t0) / args.n * 1e6, 3)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import pickle
+import time
+
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+
+from train_pipeline import PrototypeTrainer
+
+
+# Inference latency vs training size: plain KNN on all samples vs KNN on prototypes (train_pipeline)
+# on synthetic labelled windows (normalized nitrate / turbidity, noisy boundary)
+#   python benchmark_training.py --sizes 1000 10000 100000 1000000
+def synthetic(n, rng):
+    X = rng.uniform(0, 1.2, size=(n, 2))
+    bad = X[:, 0] * 0.6 + X[:, 1] + rng.normal(0, 0.05, n) > 0.55
+    return X, np.where(bad, "bad", "good")
+
+
+def per_sample_us(model, X, batch):
+    t0 = time.perf_counter()
+    for i in range(0, len(X), batch):
+        model.predict(X[i:i + batch])
+    return (time.perf_counter() - t0) / len(X) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference latency vs training size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--prototypes", type=int, default=64)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    X_test, y_test = synthetic(args.queries, rng)
+    results = []
+
+    for n in args.sizes:
+        X, y = synthetic(n, rng)
+        row = {"train_size": n}
+
+        for name, fit in (
+            ("knn_all", lambda: KNeighborsClassifier(n_neighbors=args.k, algorithm="kd_tree").fit(X, y)),
+            ("knn_prototypes", lambda: fit_prototypes(X, y, args.prototypes, args.k)),
+        ):
+            t0 = time.perf_counter()
+            model = fit()
+            row[f"{name}_fit_s"] = round(time.perf_counter() - t0, 3)
+            row[f"{name}_model_kb"] = round(len(pickle.dumps(model)) / 1024, 1)
+            row[f"{name}_single_us"] = round(per_sample_us(model, X_test[:500], 1), 1)
+            row[f"{name}_batch64_us"] = round(per_sample_us(model, X_test, 64), 2)
+            row[f"{name}_accuracy"] = round(float((model.predict(X_test) == y_test).mean()), 4)
+
+        results.append(row)
+        print(json.dumps(row))
+
+    print(json.dumps(results, indent=2))
+
+
+# same chunked path as the pipeline
+def fit_prototypes(X, y, n_prototypes, k, chunk=10000):
+    trainer = PrototypeTrainer(n_prototypes=n_prototypes, k=k)
+    for i in range(0, len(X), chunk):
+        trainer.partial_fit(X[i:i + chunk], y[i:i + chunk])
+    return trainer.build()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+# Compiled lookup table of a 2-D classifier.
+# The decision regions of `model` are rasterized once over the normalized
+# [nitrate, turbidity] domain [0, max_norm) x [0, max_norm) with `resolution` cells per axis
+# (the label of a cell is the model's label at the cell center).
+# A prediction is then an O(1) array index instead of input validation + neighbor search.
+# Points outside the domain are not answered (None / mask) -> use the exact model for them.
+class DecisionGrid:
+    def __init__(self, model, resolution=512, max_norm=1.5):
+        self.resolution = int(resolution)
+        self.max_norm = float(max_norm)
+        self.cell = self.max_norm / self.resolution
+
+        centers = (np.arange(self.resolution) + 0.5) * self.cell
+        xx, yy = np.meshgrid(centers, centers, indexing="ij")
+        labels = model.predict(np.column_stack([xx.ravel(), yy.ravel()]))
+
+        self.classes, codes = np.unique(labels, return_inverse=True)
+        self.grid = codes.reshape(self.resolution, self.resolution).astype(np.uint8)
+
+    # one normalized sample -> label, or None outside the domain
+    def lookup(self, x0, x1):
+        i = int(x0 / self.cell)
+        j = int(x1 / self.cell)
+        if 0 <= x0 and 0 <= x1 and i < self.resolution and j < self.resolution:
+            return self.classes[self.grid[i, j]]
+        return None
+
+    # X: (n, 2) normalized samples -> (labels, inside mask); labels are only valid where inside is True
+    def lookup_many(self, X):
+        X = np.asarray(X, dtype=float)
+        idx = np.floor(X / self.cell).astype(np.int64)
+        inside = (X >= 0).all(axis=1) & (idx < self.resolution).all(axis=1)
+        idx[~inside] = 0
+        return self.classes[self.grid[idx[:, 0], idx[:, 1]]], inside
+
+    # share of random points in the domain where grid and exact model agree
+    def accuracy(self, model, samples=20000, seed=0):
+        X = np.random.default_rng(seed).uniform(0, self.max_norm, size=(samples, 2))
+        labels, _ = self.lookup_many(X)
+        return float(np.mean(labels == model.predict(X)))
@@ -5,57 +5,79 @@ import cherrypy
 from sklearn.neighbors import KNeighborsClassifier
 
 from service_registry import ServiceRegistry
+from model_registry import ModelRegistry
 
 
-def now_ts(): 
+def now_ts():
     return int(time.time())
 
 
+# Demo KNN on normalized [nitrate / nitrate_scale, turbidity / turbidity_scale]
+# published as the first registry version when the registry is empty
+def fit_demo_model(k):
+    model = KNeighborsClassifier(n_neighbors=int(k))
+
+    X = [
+        # GOOD region (lower nitrate and lower turbidity)
+        [0.05, 0.05], [0.10, 0.08], [0.20, 0.10], [0.30, 0.15], [0.35, 0.20], [0.40, 0.25],
+        # BAD region (higher nitrate and/or higher turbidity)
+        [0.50, 0.30], [0.60, 0.40], [0.70, 0.50], [0.80, 0.60], [0.90, 0.70], [1.00, 0.80],
+        [0.30, 0.60], [0.40, 0.70], [0.20, 0.80],
+    ]
+    y = [
+        "good","good","good","good","good","good",
+        "bad","bad","bad","bad","bad","bad",
+        "bad","bad","bad",
+    ]
+    model.fit(X, y)
+    return model
+
+
 class PredictionService:
-    
-  
-    
+
+
+
    #   POST /predict
    #     input:  {"nitrate": number, "turbidity": number}
-   #     output: {"status":"ok","water_quality":"good|bad","ts":...}
- 
-     
-
-    def __init__(self, k, nitrate_scale, turbidity_scale):
-        self.k = int(k)
-        self.nitrate_scale = float(nitrate_scale)
-        self.turbidity_scale = float(turbidity_scale)
-
-        self.model = KNeighborsClassifier(n_neighbors=self.k)
-        self._fit_demo_model()
-
-    def _norm(self, nitrate, turbidity):
-        #  normalization: put both features on comparable numeric scales
-        return [float(nitrate) / self.nitrate_scale, float(turbidity) / self.turbidity_scale]
-
-    def _fit_demo_model(self):
-        
-        
-        X = [
-            # GOOD region (lower nitrate and lower turbidity)
-            [0.05, 0.05], [0.10, 0.08], [0.20, 0.10], [0.30, 0.15], [0.35, 0.20], [0.40, 0.25],
-            # BAD region (higher nitrate and/or higher turbidity)
-            [0.50, 0.30], [0.60, 0.40], [0.70, 0.50], [0.80, 0.60], [0.90, 0.70], [1.00, 0.80],
-            [0.30, 0.60], [0.40, 0.70], [0.20, 0.80],
-        ]
-        y = [
-            "good","good","good","good","good","good",
-            "bad","bad","bad","bad","bad","bad",
-            "bad","bad","bad",
-        ]
-        self.model.fit(X, y)
+   #     output: {"status":"ok","water_quality":"good|bad","model_version":"v1","ts":...}
+   #
+   #   POST /predict/batch
+   #     input:  {"samples": [{"nitrate": number, "turbidity": number}, ...]}
+   #     output: {"status":"ok","water_quality":["good|bad", ...],"model_version":"v1","ts":...}   (same order as samples)
+   #
+   #   GET /models
+   #     output: current version, available versions, per-version request counts and latency
+
+
+
+    def __init__(self, registry, max_batch=1000):
+        self.registry = registry
+        self.max_batch = int(max_batch)
+
+    # every request uses one model version from start to end, even if a new one is swapped in meanwhile
+    def _classify(self, samples):
+        loaded = self.registry.current()
+        if loaded is None:
+            cherrypy.response.status = 503
+            return None, {"status": "error", "message": "no model available"}
+
+        start = time.perf_counter()
+        labels = loaded.predict(samples)
+        loaded.record(len(samples), (time.perf_counter() - start) * 1000.0)
+        return loaded, labels
 
     @cherrypy.expose
     @cherrypy.tools.json_in()
     @cherrypy.tools.json_out()
-    def predict(self):
+    def predict(self, *uri):
         data = cherrypy.request.json or {}
 
+        if uri == ("batch",):
+            return self.predict_batch(data)
+        if uri:
+            cherrypy.response.status = 404
+            return {"status": "error", "message": "Not found"}
+
         nitrate = data.get("nitrate")
         turbidity = data.get("turbidity")
 
@@ -63,17 +85,51 @@ class PredictionService:
             cherrypy.response.status = 400
             return {"status": "error", "message": "nitrate and turbidity must be numbers"}
 
-         
-        x = self._norm(nitrate, turbidity)
+        loaded, labels = self._classify([{"nitrate": nitrate, "turbidity": turbidity}])
+        if loaded is None:
+            return labels
+
+        return {
+            "status": "ok",
+            "water_quality": labels[0],
+            "model_version": loaded.version,
+            "ts": now_ts()
+        }
+
+    # all samples are classified with one vectorized call
+    def predict_batch(self, data):
+        samples = data.get("samples")
+        if not isinstance(samples, list) or not samples:
+            cherrypy.response.status = 400
+            return {"status": "error", "message": "samples must be a non-empty list"}
+
+        if len(samples) > self.max_batch:
+            cherrypy.response.status = 400
+            return {"status": "error", "message": f"at most {self.max_batch} samples per request"}
+
+        for i, sample in enumerate(samples):
+            nitrate = sample.get("nitrate") if isinstance(sample, dict) else None
+            turbidity = sample.get("turbidity") if isinstance(sample, dict) else None
+            if not isinstance(nitrate, (int, float)) or not isinstance(turbidity, (int, float)):
+                cherrypy.response.status = 400
+                return {"status": "error", "message": f"sample {i}: nitrate and turbidity must be numbers"}
 
-        label = self.model.predict([x])[0]
+        loaded, labels = self._classify(samples)
+        if loaded is None:
+            return labels
 
         return {
             "status": "ok",
-            "water_quality": label,
+            "water_quality": labels,
+            "model_version": loaded.version,
             "ts": now_ts()
         }
 
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def models(self):
+        return {"status": "ok", **self.registry.snapshot()}
+
 
 def load_config():
     with open("config.json", "r") as f:
@@ -87,29 +143,42 @@ def main():
     host = cfg.get("host", "localhost")
     port = int(cfg.get("port", 8092))
 
-    
+
     catalog_host = cfg.get("catalog_host", "localhost")
     catalog_port = int(cfg.get("catalog_port", 8080))
 
-    # Normalization scales
+    # Normalization scales (of the demo model)
     nitrate_scale = cfg.get("nitrate_scale", 100)
     turbidity_scale = cfg.get("turbidity_scale", 100)
 
     # Register in Service Catalogue
     registry = ServiceRegistry(catalog_host=catalog_host, catalog_port=catalog_port)
     registry.register(name, host, port)
+    registry.start_heartbeat()
+
+    # Model registry (directory of versioned models); seeded with the demo model when empty
+    models = ModelRegistry(cfg.get("model_dir", "models"), grid_cfg=cfg.get("decision_grid", {}))
+    if not models.versions():
+        version = models.publish(fit_demo_model(cfg.get("k", 3)), {
+            "algorithm": "knn",
+            "k": int(cfg.get("k", 3)),
+            "features": ["nitrate", "turbidity"],
+            "scaler": {"nitrate": nitrate_scale, "turbidity": turbidity_scale},
+        })
+        print(f"[MODEL] registry empty, published demo model as {version}")
 
-    app = PredictionService(
-        k=cfg.get("k", 3),
-        nitrate_scale=nitrate_scale,
-        turbidity_scale=turbidity_scale
-    )
+    app = PredictionService(models, max_batch=cfg.get("max_batch", 1000))
 
     cherrypy.config.update({
         "server.socket_host": host,
         "server.socket_port": port,
     })
 
+    # swap in a new model version when CURRENT changes - no restart, in-flight requests finish on the old one
+    cherrypy.process.plugins.Monitor(
+        cherrypy.engine, models.check, frequency=int(cfg.get("model_reload_check_sec", 5)), name="model-reload"
+    ).subscribe()
+
     cherrypy.quickstart(app, "/")
 
 
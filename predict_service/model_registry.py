@@ -0,0 +1,180 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from decision_grid import DecisionGrid
+
+# Model registry on disk:
+#   models/
+#     v1/model.pkl     pickled classifier
+#     v1/meta.json     {"version", "created_at", "algorithm", "features": ["nitrate", "turbidity"],
+#                       "scaler": {"nitrate": 100, "turbidity": 100}, "labels": {"0": "good", "1": "bad"}, ...}
+#     v2/...
+#     CURRENT          name of the version to serve ("v2")
+# The model input is [value / scaler[f] for f in features]; "labels" (optional) maps raw model output to good / bad.
+
+
+# One loaded, immutable model version + its request counters
+class LoadedModel:
+    def __init__(self, version, model, meta, grid_cfg=None):
+        self.version = version
+        self.model = model
+        self.meta = meta
+        self.features = meta.get("features", ["nitrate", "turbidity"])
+        self.scales = np.array([float(meta.get("scaler", {}).get(f, 1.0)) for f in self.features])
+        self.labels = {str(k): v for k, v in (meta.get("labels") or {}).items()}
+
+        self.grid = None
+        if grid_cfg and grid_cfg.get("enabled", False) and len(self.features) == 2:
+            self.grid = self._compile_grid(grid_cfg)
+
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "samples": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0}
+
+    def _compile_grid(self, grid_cfg):
+        grid = DecisionGrid(
+            self.model,
+            resolution=int(grid_cfg.get("resolution", 512)),
+            max_norm=float(self.meta.get("input_max", grid_cfg.get("max_norm", 1.5))),
+        )
+        accuracy = grid.accuracy(self.model)
+        min_accuracy = float(grid_cfg.get("min_accuracy", 0.99))
+        if accuracy < min_accuracy:
+            print(f"[GRID] {self.version}: agreement with exact model {accuracy:.4f} < {min_accuracy}, grid disabled")
+            return None
+        print(f"[GRID] {self.version}: {grid.resolution}x{grid.resolution} grid, agreement with exact model {accuracy:.4f}")
+        return grid
+
+    # samples: [{"nitrate": .., "turbidity": ..}, ...] (already validated) -> list of labels
+    def predict(self, samples):
+        X = np.array([[float(s[f]) for f in self.features] for s in samples]) / self.scales
+
+        if self.grid:
+            raw, inside = self.grid.lookup_many(X)
+            if not inside.all():
+                raw = raw.astype(object)
+                raw[~inside] = self.model.predict(X[~inside]) # outside the grid domain
+        else:
+            raw = self.model.predict(X)
+
+        return [self.labels.get(str(label), str(label)) for label in raw.tolist()]
+
+    def record(self, samples, latency_ms):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["samples"] += samples
+            self.stats["latency_ms_total"] += latency_ms
+            self.stats["latency_ms_max"] = max(self.stats["latency_ms_max"], latency_ms)
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+        out["latency_ms_avg"] = out["latency_ms_total"] / out["requests"] if out["requests"] else 0.0
+        out["grid"] = self.grid is not None
+        out["created_at"] = self.meta.get("created_at")
+        out["algorithm"] = self.meta.get("algorithm")
+        return out
+
+
+class ModelRegistry:
+    def __init__(self, directory, grid_cfg=None):
+        self.directory = directory
+        self.grid_cfg = grid_cfg or {}
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._current = None  # LoadedModel - swapped as a whole, requests keep the one they started with
+        self._current_mtime = None
+        self._load_lock = threading.Lock()
+        self.seen = {}  # version -> LoadedModel (stats of older versions stay visible)
+
+    # ---------- publishing ----------
+
+    def versions(self):
+        names = [n for n in os.listdir(self.directory) if n.startswith("v") and n[1:].isdigit()]
+        return sorted(names, key=lambda n: int(n[1:]))
+
+    # writes a new version (temp dir + rename) and makes it current
+    def publish(self, model, meta):
+        versions = self.versions()
+        version = f"v{int(versions[-1][1:]) + 1 if versions else 1}"
+
+        tmp_dir = os.path.join(self.directory, f".tmp-{version}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        meta = dict(meta, version=version, created_at=meta.get("created_at", int(time.time())))
+        with open(os.path.join(tmp_dir, "model.pkl"), "wb") as f:
+            pickle.dump(model, f)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+        os.rename(tmp_dir, os.path.join(self.directory, version))
+        self.set_current(version)
+        return version
+
+    def set_current(self, version):
+        path = os.path.join(self.directory, "CURRENT")
+        with open(path + ".tmp", "w") as f:
+            f.write(version)
+        os.replace(path + ".tmp", path)
+
+    # ---------- loading ----------
+
+    def current_name(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT"), "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            versions = self.versions()
+            return versions[-1] if versions else None
+
+    def load(self, version):
+        version_dir = os.path.join(self.directory, version)
+        with open(os.path.join(version_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+        with open(os.path.join(version_dir, "model.pkl"), "rb") as f:
+            model = pickle.load(f)
+        return LoadedModel(version, model, meta, self.grid_cfg)
+
+    # called periodically (CherryPy Monitor plugin) and lazily by the first request:
+    # loads the version named in CURRENT if it changed, then swaps it in
+    def check(self):
+        with self._load_lock:
+            path = os.path.join(self.directory, "CURRENT")
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            if self._current is not None and mtime == self._current_mtime:
+                return
+
+            version = self.current_name()
+            if version is None or (self._current is not None and version == self._current.version):
+                self._current_mtime = mtime
+                return
+
+            try:
+                loaded = self.seen.get(version) or self.load(version)  # rollback reuses the loaded model
+            except Exception as e:
+                print(f"[MODEL] loading {version} failed, keeping {self._current.version if self._current else None} -> {e}")
+                return
+
+            self.seen[version] = loaded
+            self._current = loaded
+            self._current_mtime = mtime
+            print(f"[MODEL] serving {version}")
+
+    def current(self):
+        if self._current is None:
+            self.check()
+        return self._current
+
+    def snapshot(self):
+        current = self._current
+        return {
+            "current": current.version if current else None,
+            "available": self.versions(),
+            "versions": {v: m.snapshot() for v, m in self.seen.items()},
+        }
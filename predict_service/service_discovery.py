@@ -0,0 +1,197 @@
+import threading
+import time
+
+import requests
+
+
+# --------------------------------------------------
+# Service discovery with client-side load balancing
+# --------------------------------------------------
+# Resolves a service name to its instances through GET /services/<name> of the catalogue and
+# spreads the calls over the instances that are up:
+# - "round_robin": smooth weighted round robin (an instance of weight 2 gets twice the calls)
+# - "least_outstanding": the instance with the fewest calls in flight per unit of weight
+#   (round robin among the instances tied for the fewest)
+# Instance lists are cached for ttl_sec; an instance that refused a connection or answered 5xx
+# is skipped for failure_cooldown_sec (unless no other instance is left).
+# Long-running services also call start_watch(): a background long poll of
+# GET /services?watch=<version> updates the cached services as soon as one registers, is redeployed,
+# goes down or expires, so calls neither wait for the TTL nor ask the catalogue each time.
+#   discovery.request("prediction_service", "POST", "/predict/batch", json=..., timeout=4)
+class ServiceDiscovery:
+    def __init__(self, catalog_base_url, strategy="round_robin", ttl_sec=15,
+                 failure_cooldown_sec=10, timeout=4, watch_timeout_sec=25):
+        if strategy not in ("round_robin", "least_outstanding"):
+            raise ValueError(f"unknown load balancing strategy {strategy}")
+        self.base = catalog_base_url.rstrip("/")
+        self.strategy = strategy
+        self.ttl = float(ttl_sec)
+        self.failure_cooldown = float(failure_cooldown_sec)
+        self.timeout = timeout
+        self.watch_timeout = float(watch_timeout_sec)
+
+        self.version = None  # services version of the catalogue the cache is at (watch)
+        self._watch = None
+        self._instances = {}  # name -> (expires monotonic, [instance, ...] that are up)
+        self._current = {}  # url -> smooth round robin counter
+        self._outstanding = {}  # url -> calls in flight
+        self._failed_until = {}  # url -> monotonic time it is skipped until
+        self._lock = threading.Lock()
+
+        self.stats = {"lookups": 0, "lookup_errors": 0, "calls": 0, "failures": 0, "watch_updates": 0, "watch_errors": 0}
+
+    # instances of `name` that are up (cached) -> [{"instance_id", "url", "weight", ...}]
+    def instances(self, name):
+        with self._lock:
+            cached = self._instances.get(name)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+
+        instances = self._lookup(name)
+        with self._lock:
+            if instances is None:
+                # catalogue unreachable: keep the last known instances, ask again after the TTL
+                instances = cached[1] if cached else []
+            self._instances[name] = (time.monotonic() + self.ttl, instances)
+        return instances
+
+    def _lookup(self, name):
+        try:
+            r = requests.get(f"{self.base}/services/{name}", timeout=self.timeout)
+            with self._lock:
+                self.stats["lookups"] += 1
+            if r.status_code in (404, 503):
+                return []  # not registered / no instance up
+            r.raise_for_status()
+            return up_instances(r.json()["service"])
+        except Exception as e:
+            print(f"[DISCOVERY] lookup of {name} failed -> {e}")
+            with self._lock:
+                self.stats["lookup_errors"] += 1
+            return None
+
+    # long poll the catalogue in a daemon thread (call once); only the services looked up so far are watched
+    def start_watch(self):
+        if self._watch is None:
+            self._watch = threading.Thread(target=self._watch_loop, name="discovery-watch", daemon=True)
+            self._watch.start()
+
+    def _watch_loop(self):
+        backoff = 1
+        while True:
+            with self._lock:
+                names = sorted(self._instances)
+                version = self.version
+            params = {"names": ",".join(names), "timeout": self.watch_timeout}
+            if version is not None:
+                params["watch"] = version
+            try:
+                r = requests.get(f"{self.base}/services", params=params, timeout=self.watch_timeout + self.timeout)
+                r.raise_for_status()
+                data = r.json()
+                services = {s["name"]: s for s in data["services"]}
+            except Exception as e:
+                print(f"[DISCOVERY] watch failed -> {e}")
+                with self._lock:
+                    self.stats["watch_errors"] += 1
+                time.sleep(backoff)  # meanwhile the cache falls back to its TTL
+                backoff = min(backoff * 2, 30)
+                continue
+
+            backoff = 1
+            # valid until the next answer is overdue (the catalogue answers at least every watch_timeout)
+            expires = time.monotonic() + max(self.ttl, 2 * self.watch_timeout + self.timeout)
+            with self._lock:
+                for name in names:
+                    service = services.get(name)
+                    self._instances[name] = (expires, up_instances(service) if service else [])
+                if data.get("version") != self.version:
+                    self.version = data.get("version")
+                    self.stats["watch_updates"] += 1
+
+    # base url of one instance of `name` (balanced), None if no instance is up
+    def url(self, name):
+        instance = self._pick(name)
+        return instance["url"] if instance else None
+
+    # one HTTP call to an instance of `name`; on a connection error or 5xx the next instance is tried
+    # (up to `retries` more times) -> requests.Response, raises requests.ConnectionError if none answered
+    def request(self, name, method, path, retries=1, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        error = None
+        for _ in range(retries + 1):
+            instance = self._pick(name, track=True)
+            if instance is None:
+                break
+            url = instance["url"]
+            ok = False
+            try:
+                r = requests.request(method, url + path, **kwargs)
+                ok = r.status_code < 500
+                if ok:
+                    return r
+                error = requests.HTTPError(f"{r.status_code} from {url}", response=r)
+            except requests.RequestException as e:
+                error = e
+            finally:
+                self._release(url, ok)
+
+        if isinstance(error, requests.HTTPError):
+            return error.response  # every instance answered 5xx: let the caller see the answer
+        raise requests.ConnectionError(f"no instance of {name} reachable ({error})")
+
+    def _pick(self, name, track=False):
+        instances = self.instances(name)
+        now = time.monotonic()
+        with self._lock:
+            healthy = [i for i in instances if self._failed_until.get(i["url"], 0) <= now] or instances
+            if not healthy:
+                return None
+
+            if self.strategy == "least_outstanding":
+                load = {i["url"]: self._outstanding.get(i["url"], 0) / float(i.get("weight", 1)) for i in healthy}
+                least = min(load.values())
+                # ties (e.g. serial callers, nothing in flight) are shared out by weighted round robin
+                healthy = [i for i in healthy if load[i["url"]] == least]
+
+            total = 0.0
+            chosen = None
+            for i in healthy:
+                weight = float(i.get("weight", 1))
+                total += weight
+                self._current[i["url"]] = self._current.get(i["url"], 0.0) + weight
+                if chosen is None or self._current[i["url"]] > self._current[chosen["url"]]:
+                    chosen = i
+            self._current[chosen["url"]] -= total
+
+            if track:
+                self._outstanding[chosen["url"]] = self._outstanding.get(chosen["url"], 0) + 1
+                self.stats["calls"] += 1
+            return chosen
+
+    def _release(self, url, ok):
+        with self._lock:
+            self._outstanding[url] -= 1
+            if ok:
+                self._failed_until.pop(url, None)
+            else:
+                self._failed_until[url] = time.monotonic() + self.failure_cooldown
+                self.stats["failures"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["version"] = self.version
+            out["outstanding"] = {url: n for url, n in self._outstanding.items() if n}
+            out["failed"] = sorted(url for url, until in self._failed_until.items() if until > time.monotonic())
+        return out
+
+
+# instances of a service (GET /services answer) that are up and not drained, urls without trailing "/"
+def up_instances(service):
+    instances = service.get("instances") or [{"instance_id": service["url"], "url": service["url"], "weight": 1}]
+    return [
+        dict(i, url=i["url"].rstrip("/"))
+        for i in instances
+        if i.get("status", "up") == "up" and float(i.get("weight", 1)) > 0
+    ]
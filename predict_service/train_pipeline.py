@@ -0,0 +1,252 @@
+import argparse
+import csv
+import functools
+import json
+import time
+
+import numpy as np
+import requests
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import KNeighborsClassifier
+
+from model_registry import ModelRegistry
+from service_discovery import ServiceDiscovery
+
+
+# Training pipeline for the water-quality model
+#   storage_service history (per device, in time chunks) -> one sample per device window
+#   -> per-class prototypes (streaming k-means) -> KNN on a KD-tree over the prototypes
+#   -> new version in the model registry (picked up by the running service, see ModelRegistry.check)
+#
+#   python train_pipeline.py --days 30                      # all devices of the catalogue
+#   python train_pipeline.py --devices 3 7 --days 30 --dry-run
+#   python train_pipeline.py --csv ../monitoring-service/doc/knn_training_package/knn_training/knn_training_data.csv
+#
+# Memory is bounded by one time chunk of one device, and the model size (so the
+# inference cost) by n_prototypes per class, whatever the amount of training data.
+#
+# storage_service answers a window that is a multiple of 1 hour from its hourly / daily rollups
+# and any other window (e.g. the default 600 s) from the raw rows, which it only keeps for
+# raw_retention_days (its retention.tiers.raw). Longer runs either use window_sec 3600 or are
+# cut to raw_retention_days, otherwise they would silently train on less history than asked.
+
+FEATURES = ["nitrate", "turbidity"]
+
+
+# ---------- data sources ----------
+
+def list_devices(catalog_url):
+    r = requests.get(f"{catalog_url}/devices", timeout=4)
+    r.raise_for_status()
+    return [d["device_id"] for d in r.json()["devices"]]
+
+
+# {ts: value} of one sensor over [ts_from, ts_to), one value per window
+# (field: "avg", "min", "max" or "count" of the window)
+# storage_get(path, **kwargs): GET on a storage_service instance
+def fetch_windows(storage_get, device_id, sensor, ts_from, ts_to, window_sec, field="avg"):
+    r = storage_get(
+        f"/devices/{device_id}/history",
+        params={"sensor": sensor, "from": ts_from, "to": ts_to, "bucket": window_sec},
+        timeout=30,
+    )
+    r.raise_for_status()
+    return {p["ts"]: p[field] for p in r.json()["points"]}
+
+
+# devices that stored at least one value of `sensor` in [ts_from, ts_to): one request per device,
+# answered from the daily rollup (the bucket spans the whole range in whole days)
+def devices_with_sensor(storage_get, device_ids, sensor, ts_from, ts_to):
+    bucket = -(-(ts_to - ts_from) // 86400) * 86400
+    return [d for d in device_ids if fetch_windows(storage_get, d, sensor, ts_from, ts_to, bucket, "count")]
+
+
+# Yields (X, labels) per (device, time chunk):
+#   X[i] = [avg nitrate, avg turbidity] of one window, labels[i] = "bad" if the label sensor
+#   was raised (max >= 0.5) in that window else "good". Windows without a label or a feature are skipped.
+def iter_history_batches(storage_get, device_ids, ts_from, ts_to, window_sec, chunk_sec, label_sensor):
+    chunk_sec = max(window_sec, chunk_sec - chunk_sec % window_sec)  # chunks made of whole windows
+    ts_from -= ts_from % window_sec  # so no window is split between two chunks
+
+    for device_id in device_ids:
+        for start in range(ts_from, ts_to, chunk_sec):
+            end = min(start + chunk_sec, ts_to)
+            columns = [fetch_windows(storage_get, device_id, s, start, end, window_sec) for s in FEATURES]
+            labels = fetch_windows(storage_get, device_id, label_sensor, start, end, window_sec, "max")
+
+            windows = sorted(ts for ts in labels if all(ts in c for c in columns))
+            if windows:
+                X = np.array([[c[ts] for c in columns] for ts in windows])
+                yield X, ["bad" if labels[ts] >= 0.5 else "good" for ts in windows]
+
+
+# Legacy CSV (turbidity,nitrate,service_needed) read in chunks of chunk_rows
+def iter_csv_batches(path, chunk_rows=10000):
+    with open(path, "r", newline="") as f:
+        X, labels = [], []
+        for row in csv.DictReader(f):
+            X.append([float(row[name]) for name in FEATURES])
+            labels.append("bad" if float(row["service_needed"]) >= 0.5 else "good")
+            if len(X) >= chunk_rows:
+                yield np.array(X), labels
+                X, labels = [], []
+        if X:
+            yield np.array(X), labels
+
+
+# ---------- model ----------
+
+# KNN over a fixed number of prototypes per class.
+# Prototypes are the centers of a mini-batch k-means fitted per class with partial_fit,
+# so the training data is seen once, chunk by chunk, and never held in memory.
+# A class with fewer samples than n_prototypes keeps its samples as prototypes.
+class PrototypeTrainer:
+    def __init__(self, n_prototypes=64, k=3, seed=0):
+        self.n_prototypes = int(n_prototypes)
+        self.k = int(k)
+        self.seed = seed
+
+        self._kmeans = {}  # label -> MiniBatchKMeans
+        self._pending = {}  # label -> samples waiting for the first partial_fit (needs >= n_prototypes)
+        self.counts = {}
+
+    def partial_fit(self, X, labels):
+        labels = np.asarray(labels)
+        for label in np.unique(labels):
+            Xc = X[labels == label]
+            self.counts[str(label)] = self.counts.get(str(label), 0) + len(Xc)
+
+            km = self._kmeans.get(label)
+            if km is None:
+                pending = self._pending.get(label)
+                Xc = Xc if pending is None else np.vstack([pending, Xc])
+                if len(Xc) < self.n_prototypes:
+                    self._pending[label] = Xc
+                    continue
+                self._pending.pop(label, None)
+                km = self._kmeans[label] = MiniBatchKMeans(
+                    n_clusters=self.n_prototypes, random_state=self.seed, n_init=3
+                )
+            km.partial_fit(Xc)
+
+    def build(self):
+        prototypes, prototype_labels = [], []
+        for label, km in self._kmeans.items():
+            prototypes.append(km.cluster_centers_)
+            prototype_labels += [label] * len(km.cluster_centers_)
+        for label, Xc in self._pending.items():
+            prototypes.append(Xc)
+            prototype_labels += [label] * len(Xc)
+
+        if not prototypes:
+            raise ValueError("no labelled samples")
+
+        prototypes = np.vstack(prototypes)
+        model = KNeighborsClassifier(n_neighbors=min(self.k, len(prototypes)), algorithm="kd_tree")
+        model.fit(prototypes, prototype_labels)
+        return model
+
+
+# ---------- pipeline ----------
+
+def train(batches, scales, n_prototypes=64, k=3):
+    trainer = PrototypeTrainer(n_prototypes=n_prototypes, k=k)
+    input_max = np.zeros(len(FEATURES))
+
+    for X, labels in batches:
+        X = X / scales
+        input_max = np.maximum(input_max, X.max(axis=0))
+        trainer.partial_fit(X, labels)
+
+    model = trainer.build()
+    meta = {
+        "algorithm": "knn-prototypes",
+        "k": model.n_neighbors,
+        "features": FEATURES,
+        "scaler": dict(zip(FEATURES, scales.tolist())),
+        "samples": trainer.counts,
+        "prototypes": int(model.n_samples_fit_),
+        "input_max": float(max(1.0, input_max.max())),  # domain of the decision grid
+    }
+    return model, meta
+
+
+def load_config(path="config.json"):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the water-quality model and publish it to the registry")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--devices", nargs="*", help="device ids (default: all devices of the catalogue)")
+    parser.add_argument("--days", type=int, help="days of history to train on")
+    parser.add_argument("--csv", help="train from a labelled csv instead of storage_service")
+    parser.add_argument("--dry-run", action="store_true", help="train and report, do not publish")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    train_cfg = cfg.get("training", {})
+    scales = np.array([float(cfg.get("nitrate_scale", 100)), float(cfg.get("turbidity_scale", 100))])
+
+    if args.csv:
+        batches = iter_csv_batches(args.csv)
+        source = args.csv
+    else:
+        catalog_url = f"http://{cfg.get('catalog_host', 'localhost')}:{int(cfg.get('catalog_port', 8080))}"
+        # history requests spread over the storage_service instances (a restarted one is skipped)
+        discovery = ServiceDiscovery(catalog_url)
+        storage_get = functools.partial(discovery.request, train_cfg.get("storage_service", "storage_service"), "GET")
+        device_ids = args.devices or list_devices(catalog_url)
+
+        days = args.days or int(train_cfg.get("days", 30))
+        window_sec = int(train_cfg.get("window_sec", 600))
+        raw_days = int(train_cfg.get("raw_retention_days", 30))
+        if window_sec % 3600 and days > raw_days:
+            print(f"[TRAIN] {window_sec} s windows are read from the raw rows, kept {raw_days} days: "
+                  f"training on {raw_days} days instead of {days} (use window_sec 3600 for longer ranges)")
+            days = raw_days
+
+        ts_to = int(time.time())
+        ts_from = ts_to - days * 86400
+
+        # the device connector does not publish a label: it has to be stored by the devices
+        # (or an operator tool) as one more sensor of aquarium/<id>/sensors/agg, 1 = service needed
+        label_sensor = train_cfg.get("label_sensor", "service_needed")
+        device_ids = devices_with_sensor(storage_get, device_ids, label_sensor, ts_from, ts_to)
+        if not device_ids:
+            raise SystemExit(
+                f"no device stored a '{label_sensor}' value in the last {days} days: publish the label "
+                f"with the sensor data or train from a labelled file with --csv"
+            )
+        batches = iter_history_batches(
+            storage_get,
+            device_ids,
+            ts_from,
+            ts_to,
+            window_sec=window_sec,
+            chunk_sec=int(train_cfg.get("chunk_days", 1)) * 86400,
+            label_sensor=label_sensor,
+        )
+        source = f"storage_service, {len(device_ids)} devices, {ts_from}..{ts_to}"
+
+    t0 = time.perf_counter()
+    model, meta = train(
+        batches,
+        scales,
+        n_prototypes=int(train_cfg.get("n_prototypes", 64)),
+        k=int(cfg.get("k", 3)),
+    )
+    meta["source"] = source
+    print(f"[TRAIN] {meta['samples']} samples -> {meta['prototypes']} prototypes in {time.perf_counter() - t0:.1f}s")
+
+    if args.dry_run:
+        print(json.dumps(meta, indent=2))
+        return
+
+    version = ModelRegistry(cfg.get("model_dir", "models")).publish(model, meta)
+    print(f"[TRAIN] published {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from main import CatalogStorage, DevicesAPI
+
+
+# CatalogStorage at fleet size: registration, GET /devices list, index lookups, startup
+#   python benchmark_catalogue.py --devices 100000
+SENSORS = ["temperature", "nitrate", "turbidity", "Ph", "leakage", "oxygen", "ammonia", "salinity"]
+
+
+def timed(fn, repeat=1):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - t0) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the catalogue storage")
+    parser.add_argument("--devices", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="catalogue-bench-")
+
+    class Storage(CatalogStorage):
+        STATE_FILE = os.path.join(workdir, "catalog_state.json")
+        LOG_FILE = os.path.join(workdir, "catalog_changes.log")
+
+    rng = random.Random(1)
+    storage = Storage()
+
+    t0 = time.perf_counter()
+    for i in range(args.devices):
+        storage.register_or_get_device({
+            "device_label": f"aq-{i}",
+            "location": f"floor{i % 50}",
+            "aquarium_name": f"aq{i}",
+            "resources": [
+                {"name": name, "kind": "sensor", "threshold": {"min": 0, "max": 100}}
+                for name in rng.sample(SENSORS, 4)
+            ] + [{"name": "water_pump", "kind": "actuator"}],
+        })
+    register_s = time.perf_counter() - t0
+
+    devices = storage.devices_by_id
+    results = {
+        "devices": len(devices),
+        "register_us_per_device": round(register_s / args.devices * 1e6, 1),
+    }
+
+    # GET /devices: per-request iteration + encoding (before) vs the versioned summary list
+    def naive_list():
+        items = [{"device_id": d["device_id"], "device_label": d["device_label"]} for d in devices.values()]
+        return json.dumps({"devices": items, "broker": storage.broker}).encode("utf-8")
+
+    # the shipped GET /devices path (outside a request cherrypy.response is a default response object)
+    cached_list = DevicesAPI(storage)._summary_body
+
+    _, results["list_naive_ms"] = timed(naive_list, args.repeat)
+    _, results["list_cached_first_ms"] = timed(cached_list)
+    _, results["list_cached_ms"] = timed(cached_list, args.repeat)
+
+    # lookups: linear scan vs secondary index
+    def scan_sensor():
+        return {d["device_id"] for d in devices.values() if any(r["name"] == "oxygen" for r in d["resources"])}
+
+    def scan_location_sensor():
+        return {
+            d["device_id"] for d in devices.values()
+            if d.get("location") == "floor7" and any(r["name"] == "oxygen" for r in d["resources"])
+        }
+
+    expected, results["by_sensor_scan_ms"] = timed(scan_sensor, args.repeat)
+    found, results["by_sensor_index_ms"] = timed(lambda: storage.find_devices(sensor="oxygen"), args.repeat)
+    assert found == expected
+    expected, results["by_location_sensor_scan_ms"] = timed(scan_location_sensor, args.repeat)
+    found, results["by_location_sensor_index_ms"] = timed(
+        lambda: storage.find_devices(location="floor7", sensor="oxygen"), args.repeat
+    )
+    assert found == expected
+    _, results["by_aquarium_index_us"] = timed(lambda: storage.find_devices(aquarium_name="aq42"), args.repeat * 100)
+    results["by_aquarium_index_us"] = round(results["by_aquarium_index_us"] * 1000.0, 2)
+
+    # startup: snapshot + log replay + index build
+    _, results["startup_ms"] = timed(Storage)
+    results["snapshot_mb"] = round(os.path.getsize(Storage.STATE_FILE) / 1e6, 1)
+
+    for key, value in results.items():
+        if isinstance(value, float):
+            results[key] = round(value, 3)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import cherrypy
+import requests
+
+from main import CatalogStorage, Root
+
+
+# Concurrent load test of the catalogue: writers (re)register devices and services and update
+# thresholds while readers list and look up devices, all through the real CherryPy server.
+# Afterwards the state is checked for lost updates / duplicate ids and reloaded from disk.
+#   python load_test.py --writers 16 --readers 16 --labels 2000 --seconds 20
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of the service catalogue")
+    parser.add_argument("--port", type=int, default=18090)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--labels", type=int, default=2000, help="distinct device labels (writers collide on them)")
+    parser.add_argument("--seconds", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="catalogue-load-")
+
+    class Storage(CatalogStorage):
+        STATE_FILE = os.path.join(workdir, "catalog_state.json")
+        LOG_FILE = os.path.join(workdir, "catalog_changes.log")
+        COMPACT_EVERY = 500
+
+    storage = Storage()
+    cherrypy.config.update({
+        "server.socket_host": "127.0.0.1",
+        "server.socket_port": args.port,
+        "server.thread_pool": args.writers + args.readers,
+        "log.screen": False,
+        "engine.autoreload.on": False,
+    })
+    conf = {
+        "/services": {"request.dispatch": cherrypy.dispatch.MethodDispatcher()},
+        "/devices": {"request.dispatch": cherrypy.dispatch.MethodDispatcher()},
+    }
+    cherrypy.tree.mount(Root(storage), "/", conf)
+    cherrypy.engine.start()
+
+    base = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + args.seconds
+    lock = threading.Lock()
+    stats = {"writes": 0, "reads": 0, "errors": 0}
+    read_ms = []
+    last_max = {}  # label -> highest threshold max sent (last write wins per label)
+
+    def writer(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            label = f"load-{rng.randrange(args.labels)}"
+            try:
+                if rng.random() < 0.05:
+                    r = session.post(f"{base}/services/register", json={
+                        "name": f"svc-{rng.randrange(50)}", "type": "load", "host": "localhost", "port": rng.randrange(1, 65535),
+                    }, timeout=10)
+                else:
+                    r = session.post(f"{base}/devices/register", json={
+                        "device_label": label,
+                        "location": f"floor{rng.randrange(10)}",
+                        "resources": [{"name": "nitrate", "kind": "sensor", "threshold": {"min": 0, "max": 50}}],
+                    }, timeout=10)
+                    if r.status_code == 200:
+                        with lock:
+                            maximum = last_max[label] = last_max.get(label, 50) + 1
+                            r = session.put(f"{base}/devices/{r.json()['device_id']}/resources", json={
+                                "device_label": label,
+                                "resources": [{"name": "nitrate", "kind": "sensor", "threshold": {"min": 0, "max": maximum}}],
+                            }, timeout=10)
+                ok = r.status_code == 200
+            except Exception:
+                ok = False
+            with lock:
+                stats["writes"] += 1
+                stats["errors"] += int(not ok)
+
+    def reader(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            try:
+                choice = rng.random()
+                if choice < 0.3:
+                    r = session.get(f"{base}/devices", timeout=10)
+                    ok = r.status_code == 200 and "devices" in r.json()
+                elif choice < 0.5:
+                    r = session.get(f"{base}/devices", params={"sensor": "nitrate", "location": "floor3"}, timeout=10)
+                    ok = r.status_code == 200
+                elif choice < 0.6:
+                    r = session.get(f"{base}/services", timeout=10)
+                    ok = r.status_code == 200
+                else:
+                    ids = list(storage.summaries)
+                    if not ids:
+                        continue
+                    r = session.get(f"{base}/devices/{rng.choice(ids)}", timeout=10)
+                    ok = r.status_code == 200 and r.json()["device"]["resources"]
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                stats["reads"] += 1
+                stats["errors"] += int(not ok)
+                read_ms.append(elapsed)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(1000 + i,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    cherrypy.engine.exit()
+
+    # ---- invariants ----
+    problems = []
+    labels = storage.device_id_by_label
+    if len(set(labels.values())) != len(labels):
+        problems.append("two labels share a device_id")
+    if len(storage.devices_by_id) != len(labels):
+        problems.append(f"{len(storage.devices_by_id)} devices for {len(labels)} labels")
+    for label, device_id in labels.items():
+        device = storage.devices_by_id[device_id]
+        if device["device_label"] != label:
+            problems.append(f"{device_id} labelled {device['device_label']}, expected {label}")
+        if device["resources"][0]["threshold"]["max"] != last_max.get(label):
+            problems.append(f"{label}: lost threshold update")
+    service_ids = [s["service_id"] for s in storage.services.values()]
+    if len(set(service_ids)) != len(service_ids):
+        problems.append("duplicate service_id")
+    if storage.find_devices(sensor="nitrate") != set(storage.devices_by_id):
+        problems.append("sensor index out of date")
+
+    # last_seen is not compared: heartbeats are not persisted and loading resets it (fresh TTL)
+    def without_last_seen(services):
+        return {
+            name: dict(s, last_seen=None, instances={i: dict(inst, last_seen=None) for i, inst in s["instances"].items()})
+            for name, s in services.items()
+        }
+
+    reloaded = Storage()
+    if (reloaded.devices_by_id, reloaded.device_id_by_label, without_last_seen(reloaded.services)) != \
+            (storage.devices_by_id, storage.device_id_by_label, without_last_seen(storage.services)):
+        problems.append("state reloaded from disk differs from memory")
+
+    print(json.dumps({
+        "writes_per_sec": round(stats["writes"] / args.seconds),
+        "reads_per_sec": round(stats["reads"] / args.seconds),
+        "errors": stats["errors"],
+        "read_p50_ms": round(percentile(read_ms, 0.50), 2),
+        "read_p99_ms": round(percentile(read_ms, 0.99), 2),
+        "devices": len(storage.devices_by_id),
+        "services": len(storage.services),
+        "problems": problems[:20],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,22 @@ import cherrypy
 import json
 import os
 import random 
+import threading
 import time
 
+from mqtt_client import MQTTClient
+
 
 def now_ts():
     return int(time.time())
 
 
+# Thread safety (CherryPy calls this from its worker threads):
+# - every change runs under one writer lock (self._lock), which also orders the change log
+# - published objects are never modified: a change builds a new device / service dict and swaps the
+#   reference in (copy-on-write), so readers take no lock and never see a half-updated device
+# - readers only do single dict lookups or C-level copies (list(d.values()), set(ids)), which are
+#   atomic under the GIL, so GET requests never wait for a writer
 class CatalogStorage:
 
 
@@ -16,44 +25,234 @@ class CatalogStorage:
         # MQTT broker info 
         self.broker = {"broker": "localhost", "port": 1883, "base_topic": "aquarium"}
 
-        self.services = {}  # services: service_name -> {service_id, name, url, last_seen}
+        # bumped whenever the thresholds of a device change, copied into device["version"]
+        self.version = 0
+        # called with the device after a threshold change (publishes the config event, see run_server);
+        # called under the writer lock, so the events of a device go out in version order and the
+        # retained one is the latest (must not block: the MQTT publish only queues the message)
+        self.on_thresholds_changed = None
+
+        self.services = {}  # services: service_name -> {service_id, name, type, meta, last_seen, instances: {instance_id -> instance}}
         self.devices_by_id = {} # map :  device_id -> device object  - Database of all devices 
         self.device_id_by_label = {} # map : device_label -> device_id - If a device with the same label is registered again, the previously assigned device_id is returned
 
-        # Load state (catalogue data) from json file
+        # secondary indexes, maintained on every change (see changed / _index_device)
+        self.device_index = {
+            "kind": {},           # "sensor" / "actuator" -> {device_id}
+            "sensor": {},         # sensor name -> {device_id}
+            "location": {},       # location -> {device_id}
+            "aquarium_name": {},  # aquarium name -> {device_id}
+        }
+        self._device_keys = {}  # device_id -> {(index, key)} the device is listed under
+        self.services_by_type = {}  # service type -> {service name}
+
+        # GET /devices list: one summary per device, versioned so the list is built once per change
+        self.summaries = {}  # device_id -> {"device_id", "device_label"}
+        self.summary_version = 0
+
+        self.seq = 0 # number of the last change written to the log
+        self._log = None
+        self._log_records = 0
+        self._lock = threading.RLock() # writer lock
+
+        # bumped whenever what GET /services returns changes: registration, expiry, an instance going
+        # down / coming back (not on plain heartbeats); GET /services?watch=<version> waits on it
+        self.services_version = 0
+        self._services_changed = threading.Condition(self._lock)
+        self._down = set()  # (name, instance_id) of the instances last reported down
+
+        # Load state (catalogue data): snapshot + change log
         self.load_state()
 
     # -------- Persistence --------
+    # catalog_state.json   compacted snapshot {"seq", "broker", "services", "devices_by_id", "device_id_by_label"}
+    # catalog_changes.log  one json line per change made after the snapshot: {"seq", "type", "key", "value"}
+    #                      type "service" / "device" / "label" sets services / devices_by_id / device_id_by_label[key]
+    #                      (value null removes the key, e.g. an expired service)
+    # A change costs one appended line instead of rewriting the whole catalogue. Once the log holds
+    # COMPACT_EVERY changes, or as many changes as there are devices + services (so snapshot cost stays
+    # proportional to the changes, also with 100k devices), the state is written to a new snapshot
+    # (temp file + rename) and the log starts over.
+    # At startup the snapshot is loaded and the newer log records are replayed on top of it.
    
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     STATE_FILE = os.path.join(BASE_DIR, "catalog_state.json")
+    LOG_FILE = os.path.join(BASE_DIR, "catalog_changes.log")
+    COMPACT_EVERY = 1000
+
+    # Service liveness: every instance sends POST /services/<name>/heartbeat every few seconds (ServiceRegistry).
+    # Not heard from for SERVICE_TTL seconds -> instance reported "down" (GET /services/<name> answers 503
+    # when no instance is up), for SERVICE_EXPIRE seconds -> removed by expire_services (the instance
+    # re-registers when it comes back); a service is removed with its last instance.
+    SERVICE_TTL = 30
+    SERVICE_EXPIRE = 600
+
+    def _tables(self):
+        return {"service": self.services, "device": self.devices_by_id, "label": self.device_id_by_label}
+
+    # update the indexes and append the change to the log (caller holds self._lock)
+    # (value is serialized now, later changes of the object are separate records)
+    def changed(self, kind, key, value):
+        self._index(kind, key, value)
+        with self._lock:
+            self.seq += 1
+            self._log.write(json.dumps({"seq": self.seq, "type": kind, "key": key, "value": value}) + "\n")
+            self._log.flush()
+            self._log_records += 1
+            if self._log_records >= max(self.COMPACT_EVERY, len(self.devices_by_id) + len(self.services)):
+                self._compact()
 
     def save_state(self):
+        with self._lock:
+            self._compact()
+
+    # caller holds self._lock (no change can happen while the snapshot is serialized)
+    def _compact(self):
         data = {
+            "seq": self.seq,
             "broker": self.broker,
             "services": self.services,
             "devices_by_id": self.devices_by_id,
             "device_id_by_label": self.device_id_by_label,
         }
-        with open(self.STATE_FILE, "w") as f:
-            json.dump(data, f, indent=2)
+        tmp = self.STATE_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.STATE_FILE) # readers see the old or the new snapshot, never half of one
+
+        # everything in the log is in the snapshot now (a crash before this point only replays them again)
+        if self._log:
+            self._log.close()
+        self._log = open(self.LOG_FILE, "w")
+        self._log_records = 0
 
     def load_state(self):
-        if not os.path.exists(self.STATE_FILE):
-            return
-        try:
-            with open(self.STATE_FILE, "r") as f:
-                data = json.load(f)
-        except Exception:
-            return
+        data = {}
+        if os.path.exists(self.STATE_FILE):
+            try:
+                with open(self.STATE_FILE, "r") as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"[STATE] unreadable snapshot {self.STATE_FILE} -> {e}")
 
         self.broker = data.get("broker", self.broker)
         self.services = data.get("services", {})
         self.devices_by_id = data.get("devices_by_id", {})
         self.device_id_by_label = data.get("device_id_by_label", {})
+        self.seq = int(data.get("seq", 0))
+
+        replayed = 0
+        if os.path.exists(self.LOG_FILE):
+            tables = self._tables()
+            with open(self.LOG_FILE, "r") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue # torn last line of a crash
+                    if rec["seq"] <= self.seq:
+                        continue # already in the snapshot
+                    if rec["value"] is None:
+                        tables[rec["type"]].pop(rec["key"], None)
+                    else:
+                        tables[rec["type"]][rec["key"]] = rec["value"]
+                    self.seq = rec["seq"]
+                    replayed += 1
+        if replayed:
+            print(f"[STATE] replayed {replayed} changes")
+
+        # services saved before multi-instance registration: their url becomes the only instance
+        migrated = 0
+        for name, service in list(self.services.items()):
+            if "instances" not in service:
+                url = service.get("url", "")
+                instance = new_instance(url.split("://")[-1], url, 1, service.get("last_seen", 0))
+                self.services[name] = {k: v for k, v in service.items() if k != "url"}
+                self.services[name]["instances"] = {instance["instance_id"]: instance}
+                migrated += 1
+
+        # heartbeats are not logged, so the saved last_seen is stale: every instance gets a fresh
+        # SERVICE_TTL from startup to send one (otherwise all would be reported down, and the
+        # ones older than SERVICE_EXPIRE removed on the first check, although they are alive)
+        started = now_ts()
+        for name, service in list(self.services.items()):
+            self.services[name] = dict(
+                service,
+                last_seen=started,
+                instances={iid: dict(i, last_seen=started) for iid, i in service["instances"].items()},
+            )
+
+        self.version = max([d.get("version", 0) for d in self.devices_by_id.values()] + [0])
+        for name, service in self.services.items():
+            self._index("service", name, service)
+        for device_id, device in self.devices_by_id.items():
+            self._index("device", device_id, device)
+        if replayed or migrated or not os.path.exists(self.STATE_FILE):
+            self.save_state() # start from a fresh snapshot and an empty log
+        else:
+            self._log = open(self.LOG_FILE, "a")
+
+    # -------- Indexes --------
+
+    def _index(self, kind, key, value):
+        if kind == "device":
+            self._index_device(key, value)
+        elif kind == "service":
+            for names in self.services_by_type.values():
+                names.discard(key)
+            if value and value.get("type"):
+                self.services_by_type.setdefault(value["type"], set()).add(key)
+
+    def _index_device(self, device_id, device):
+        keys = set()
+        for r in device.get("resources", []):
+            keys.add(("kind", r.get("kind")))
+            if r.get("kind") == "sensor":
+                keys.add(("sensor", r["name"]))
+        for field in ("location", "aquarium_name"):
+            if device.get(field) is not None:
+                keys.add((field, device[field]))
+
+        # only the keys that changed are touched
+        old = self._device_keys.get(device_id, set())
+        for index, key in old - keys:
+            ids = self.device_index[index][key]
+            ids.discard(device_id)
+            if not ids:
+                del self.device_index[index][key]
+        for index, key in keys - old:
+            self.device_index[index].setdefault(key, set()).add(device_id)
+        self._device_keys[device_id] = keys
+
+        summary = {"device_id": device_id, "device_label": device.get("device_label")}
+        if self.summaries.get(device_id) != summary:
+            self.summaries[device_id] = summary
+            self.summary_version += 1
+
+    # random id of `digits` digits that is not in `taken` (caller holds self._lock)
+    @staticmethod
+    def _new_id(digits, taken):
+        while True:
+            new_id = str(random.randint(10 ** (digits - 1), 10 ** digits - 1))
+            if new_id not in taken:
+                return new_id
+
+    # ids of the devices matching all filters, e.g. find_devices(sensor="nitrate", location="floor1")
+    def find_devices(self, **filters):
+        result = None
+        for index, key in filters.items():
+            ids = self.device_index[index].get(key, set())
+            result = set(ids) if result is None else result & ids
+        return result if result is not None else set(self.devices_by_id)
 
     # -------- Services --------
 
+    # One entry per service name, holding every running instance (replica) of it.
+    # An instance is identified by "instance_id" (default host:port), so a replica registering adds
+    # an instance and a restart of the same replica replaces its own one.
+    # "weight" (default 1, 0 = drained) is used by the clients' load balancing (ServiceDiscovery).
     def upsert_service(self, payload):
        
         name = payload["name"]
@@ -62,71 +261,183 @@ class CatalogStorage:
 
        
         url = f"http://{host}:{port}"
-
-       
-        service_id = str(random.randint(100000, 999999))
-
-        self.services[name] = {
-            "service_id": service_id,
-            "name": name,
-            "url": url,
-            "last_seen": now_ts(),
-        }
-        self.save_state()
-        return self.services[name]
+        instance = new_instance(payload.get("instance_id") or f"{host}:{port}", url, payload.get("weight", 1), now_ts())
+
+        with self._lock:
+            # a re-registration keeps its service_id, a new service gets an unused one
+            current = self.services.get(name)
+            if current:
+                service_id = current["service_id"]
+                instances = dict(current["instances"])
+            else:
+                service_id = self._new_id(6, {s["service_id"] for s in self.services.values()})
+                instances = {}
+            instances[instance["instance_id"]] = instance
+
+            service = {
+                "service_id": service_id,
+                "name": name,
+                "type": payload.get("type"),
+                "meta": payload.get("meta") or {},
+                "last_seen": instance["last_seen"],
+                "instances": instances,
+            }
+            self.services[name] = service
+            self.changed("service", name, service)
+            self._down.discard((name, instance["instance_id"]))
+            self._bump_services()
+        return service
+
+    # -> refreshed instance, None if the catalogue does not know it (expired / catalogue state lost)
+    # instance_id may be left out by a service with a single instance.
+    # Only last_seen changes, so it is not written to the change log (one line per instance every
+    # few seconds would just churn the log); the snapshot picks it up at the next compaction.
+    def heartbeat(self, name, instance_id=None):
+        with self._lock:
+            service = self.services.get(name)
+            if service is None:
+                return None
+            if instance_id is None and len(service["instances"]) == 1:
+                instance_id = next(iter(service["instances"]))
+            instance = service["instances"].get(instance_id)
+            if instance is None:
+                return None
+
+            if (name, instance_id) in self._down:
+                self._down.discard((name, instance_id)) # back up
+                self._bump_services()
+            instance = dict(instance, last_seen=now_ts())
+            self.services[name] = dict(
+                service,
+                last_seen=instance["last_seen"],
+                instances=dict(service["instances"], **{instance_id: instance}),
+            )
+        return instance
+
+    # "up" if the instance sent a heartbeat (or registered) within SERVICE_TTL seconds, else "down"
+    def instance_status(self, instance):
+        return "up" if now_ts() - instance.get("last_seen", 0) <= self.SERVICE_TTL else "down"
+
+    # remove the instances not seen for SERVICE_EXPIRE seconds, and services left without instances
+    # -> ["name/instance_id", ...] removed (run periodically, see run_server)
+    def expire_services(self):
+        cutoff = now_ts() - self.SERVICE_EXPIRE
+        removed = []
+        with self._lock:
+            for name, service in list(self.services.items()):
+                alive = {iid: i for iid, i in service["instances"].items() if i.get("last_seen", 0) >= cutoff}
+                if len(alive) == len(service["instances"]):
+                    continue
+                gone = [iid for iid in service["instances"] if iid not in alive]
+                removed += [f"{name}/{iid}" for iid in gone]
+                self._down.difference_update((name, iid) for iid in gone)
+                if alive:
+                    self.services[name] = dict(service, instances=alive)
+                    self.changed("service", name, self.services[name])
+                else:
+                    del self.services[name]
+                    self.changed("service", name, None)
+                self._bump_services()
+        return removed
+
+    # notice the instances that stopped sending heartbeats (run periodically, see run_server)
+    # -> (name, instance_id) of the instances that went down since the last call
+    def check_services(self):
+        with self._lock:
+            down = {
+                (name, iid)
+                for name, service in self.services.items()
+                for iid, instance in service["instances"].items()
+                if self.instance_status(instance) == "down"
+            }
+            went_down = down - self._down
+            if down != self._down:
+                self._down = down
+                self._bump_services()
+        return went_down
+
+    # caller holds self._lock
+    def _bump_services(self):
+        self.services_version += 1
+        self._services_changed.notify_all()
+
+    # blocks until services_version differs from `since` (a change, or a catalogue restart when the
+    # client's version is from before it) or `timeout` seconds passed -> services_version
+    def wait_services(self, since, timeout):
+        with self._services_changed:
+            self._services_changed.wait_for(lambda: self.services_version != since, timeout)
+            return self.services_version
 
     # -------- Devices / Resources --------
 
     def register_or_get_device(self, payload):
         label = payload["device_label"]
 
-        # If this label already exists, return the same device 
-        if label in self.device_id_by_label:
-            device_id = self.device_id_by_label[label]
-            device = self.devices_by_id[device_id]
-            device["last_seen"] = now_ts()
-
-            # update resources on re-register
-            if "resources" in payload:
-                self.upsert_resources(device_id, payload["resources"])
-
-            self.save_state()
-            return device
-
-        # Create new device
-        device_id = str(random.randint(10000000, 99999999))
-        device = {
-            "device_id": device_id,
-            "device_label": label,
-            "created_at": now_ts(),
-            "last_seen": now_ts(),
-            "resources": []
-        }
+        with self._lock:
+            # If this label already exists, return the same device 
+            device_id = self.device_id_by_label.get(label)
+            if device_id is not None:
+                device = dict(self.devices_by_id[device_id], last_seen=now_ts())
+                for field in ("location", "aquarium_name"):
+                    if payload.get(field) is not None:
+                        device[field] = payload[field]
+
+                # update resources on re-register
+                thresholds_changed = False
+                if "resources" in payload:
+                    device, thresholds_changed = self._merge_resources(device, payload["resources"])
+                self._put_device(device)
+            else:
+                # Create new device (id unique under the lock)
+                device_id = self._new_id(8, self.devices_by_id)
+                device = {
+                    "device_id": device_id,
+                    "device_label": label,
+                    "location": payload.get("location"),
+                    "aquarium_name": payload.get("aquarium_name"),
+                    "created_at": now_ts(),
+                    "last_seen": now_ts(),
+                    "resources": []
+                }
+
+                #initial resources
+                device, thresholds_changed = self._merge_resources(device, payload.get("resources", []))
+                self._put_device(device)
+                self.device_id_by_label[label] = device_id
+                self.changed("label", label, device_id)
+
+            if thresholds_changed and self.on_thresholds_changed:
+                self.on_thresholds_changed(device)
+        return device
 
-    
-        self.devices_by_id[device_id] = device
-        self.device_id_by_label[label] = device_id
-
-        #initial resources
-        self.upsert_resources(device_id, payload.get("resources", []))
-
-        self.save_state()
-        return self.devices_by_id[device_id]
-
-    def upsert_resources(self, device_id, resources) :
-        # Ensure device exists
-        if device_id not in self.devices_by_id:
-            # If device was just created in register_or_get_device, it might not be inserted yet
-            # So create a temporary device record if needed
-            self.devices_by_id[device_id] = {
-                "device_id": device_id,
-                "device_label": None,
-                "created_at": now_ts(),
-                "last_seen": now_ts(),
-                "resources": []
-            }
+    # label (optional) is stored for the UI (admin dashboard dropdown)
+    def upsert_resources(self, device_id, resources, label=None):
+        with self._lock:
+            device = self.devices_by_id.get(device_id)
+            if device is None:
+                # unknown id (e.g. catalogue state lost): create the device record
+                device = {
+                    "device_id": device_id,
+                    "device_label": None,
+                    "created_at": now_ts(),
+                    "last_seen": now_ts(),
+                    "resources": []
+                }
+
+            device, thresholds_changed = self._merge_resources(device, resources)
+            if label:
+                device["device_label"] = label
+            self._put_device(device)
 
-        device = self.devices_by_id[device_id]
+            if thresholds_changed and self.on_thresholds_changed:
+                self.on_thresholds_changed(device)
+        return device
+
+    # -> (new device dict with the resources merged by name, thresholds changed?) - `device` is not modified
+    # caller holds self._lock (the config version is bumped here)
+    def _merge_resources(self, device, resources):
+        device_id = device["device_id"]
+        thresholds_before = device_thresholds(device)
 
         # Merge by resource name
         resources_by_name  = {r["name"]: r for r in device.get("resources", [])}
@@ -150,10 +461,31 @@ class CatalogStorage:
 
             resources_by_name [name] = item
 
-        device["resources"] = list(resources_by_name.values())
-        device["last_seen"] = now_ts()
-        self.save_state()
-        return device
+        device = dict(device, resources=list(resources_by_name.values()), last_seen=now_ts())
+
+        thresholds_changed = device_thresholds(device) != thresholds_before
+        if thresholds_changed:
+            self.version += 1
+            device["version"] = self.version
+        return device, thresholds_changed
+
+    # publish a new version of a device (caller holds self._lock)
+    def _put_device(self, device):
+        self.devices_by_id[device["device_id"]] = device
+        self.changed("device", device["device_id"], device)
+
+
+def new_instance(instance_id, url, weight, last_seen):
+    return {"instance_id": instance_id, "url": url, "weight": float(weight), "last_seen": last_seen}
+
+
+# {sensor name: threshold} of a device - what consumers (monitoring) cache
+def device_thresholds(device):
+    return {
+        r["name"]: r.get("threshold")
+        for r in device.get("resources", [])
+        if r.get("kind") == "sensor"
+    }
 
 
 class ServicesAPI:
@@ -169,29 +501,74 @@ class ServicesAPI:
         if uri == ("register",):
             s = self.storage.upsert_service(cherrypy.request.json)
             return {"status": "ok", "service": s}
+
+        # POST /services/{name}/heartbeat  {"instance_id": "host:port"}
+        # 404 -> the catalogue no longer knows the instance, it has to register again
+        if len(uri) == 2 and uri[1] == "heartbeat":
+            instance = self.storage.heartbeat(uri[0], (cherrypy.request.json or {}).get("instance_id"))
+            if instance is None:
+                raise cherrypy.HTTPError(404, "instance_not_found")
+            return {"status": "ok", "last_seen": instance["last_seen"]}
         raise cherrypy.HTTPError(404)
 
     @cherrypy.tools.json_out()
-    def GET(self, *uri):
+    def GET(self, *uri, **params):
         # GET /services
+        # GET /services?type=device_connector  (services by type index)
+        # GET /services?names=storage_service,user_catalogue  (only these services)
+        # GET /services?watch=<version>&timeout=<sec>  long poll: answers when services_version is no
+        #   longer <version> (or after timeout, max 60 s); the "version" of the answer is the next <version>
+        # every service with its instances, see _with_status
         if len(uri) == 0:
-            return {"services": list(self.storage.services.values())}
+            version = self.storage.services_version
+            if "watch" in params:
+                try:
+                    since, timeout = int(params["watch"]), min(float(params.get("timeout", 25)), 60.0)
+                except ValueError:
+                    raise cherrypy.HTTPError(400, "watch and timeout must be numbers")
+                version = self.storage.wait_services(since, timeout)
+
+            if "type" in params:
+                names = list(self.storage.services_by_type.get(params["type"], ())) # copy: writers modify the set
+            elif "names" in params:
+                names = [name for name in params["names"].split(",") if name]
+            else:
+                names = None
+            if names is None:
+                services = list(self.storage.services.values())
+            else:
+                services = [self.storage.services.get(name) for name in names]
+            return {"services": [self._with_status(s) for s in services if s is not None], "version": version}
 
         # GET /services/{name}
+        # 503 while no instance sends heartbeats, so clients fail fast instead of timing out on a dead URL
         if len(uri) == 1:
-            name = uri[0]
-            if name not in self.storage.services:
+            service = self.storage.services.get(uri[0])
+            if service is None:
                 raise cherrypy.HTTPError(404, "service_not_found")
-            return {"service": self.storage.services[name]}
+            service = self._with_status(service)
+            if service["status"] != "up":
+                raise cherrypy.HTTPError(503, "service_down")
+            return {"service": service}
 
         raise cherrypy.HTTPError(404)
 
+    # service as returned to clients: "instances" as a list, each with "status" "up" / "down"
+    # (see CatalogStorage.SERVICE_TTL), "status" "up" if any instance is up, and "url" of the most
+    # recently seen up instance for clients that do not balance over the instances
+    def _with_status(self, service):
+        instances = [dict(i, status=self.storage.instance_status(i)) for i in service["instances"].values()]
+        up = [i for i in instances if i["status"] == "up"]
+        newest = max(up or instances, key=lambda i: i["last_seen"])
+        return dict(service, instances=instances, status="up" if up else "down", url=newest["url"])
+
 
 class DevicesAPI:
     exposed = True
 
     def __init__(self, storage):
         self.storage = storage
+        self._summary_cache = (None, None) # (versions, encoded GET /devices body)
 
     @cherrypy.tools.json_in()
     @cherrypy.tools.json_out()
@@ -206,6 +583,27 @@ class DevicesAPI:
                 "broker": self.storage.broker,
                 "resources": d.get("resources", []),
             }
+
+        # POST /devices/bulk  {"device_ids": [...]}
+        # many devices in one response (same objects as GET /devices/{id})
+        if uri == ("bulk",):
+            device_ids = (cherrypy.request.json or {}).get("device_ids")
+            if not isinstance(device_ids, list):
+                raise cherrypy.HTTPError(400, "device_ids must be a list")
+
+            devices, missing = [], []
+            for device_id in device_ids:
+                device = self.storage.devices_by_id.get(str(device_id))
+                if device is None:
+                    missing.append(device_id)
+                else:
+                    devices.append(device)
+            return {
+                "devices": devices,
+                "missing": missing,
+                "version": self.storage.version,
+                "broker": self.storage.broker,
+            }
         raise cherrypy.HTTPError(404)
 
     @cherrypy.tools.json_in()
@@ -223,68 +621,135 @@ class DevicesAPI:
 
             label = body.get("device_label")
 
-            updated = self.storage.upsert_resources(device_id, body.get("resources", []))
-
-            if label:
-
-                # store label for UI (admin dashboard dropdown)
-
-                self.storage.devices_by_id[device_id]["device_label"] = label
-
-            # persist changes
-            self.storage.save_state()
+            updated = self.storage.upsert_resources(device_id, body.get("resources", []), label=label)
 
             return {"status": "ok", "device": updated, "broker": self.storage.broker}
         raise cherrypy.HTTPError(404)
 
-    @cherrypy.tools.json_out()
-    def GET(self, *uri):
+    def GET(self, *uri, **params):
         # GET /devices
-        # used by admin dashboard
+        # used by admin dashboard - served from the cached, versioned summary list
+        if len(uri) == 0 and not params:
+            cherrypy.response.headers["Content-Type"] = "application/json"
+            return self._summary_body()
+
+        # GET /devices?fields=resources&since=<version>&kind=&sensor=&location=&aquarium_name=
+        # with resources (and config version) of every device whose config changed after <version>,
+        # used by monitoring to warm its cache; "version" of the response is the next <since>
+        # kind / sensor / location / aquarium_name filter through the secondary indexes
         if len(uri) == 0:
-            devices = []
-
-            for device in self.storage.devices_by_id.values():
-                devices.append({
-                    "device_id": device["device_id"],
-                    "device_label": device["device_label"],
-                })
-
-            return {
-                "devices": devices,
-                "broker": self.storage.broker,
-            }
+            return json_body(self.list_devices(params))
 
         # GET /devices/{id}
         if len(uri) == 1:
-            device_id = uri[0]
-            if device_id not in self.storage.devices_by_id:
+            device = self.storage.devices_by_id.get(uri[0])
+            if device is None:
                 raise cherrypy.HTTPError(404, "device_not_found")
-            return {
-                "device": self.storage.devices_by_id[device_id],
+            return json_body({
+                "device": device,
                 "broker": self.storage.broker,
-            }
+            })
 
         raise cherrypy.HTTPError(404)
 
+    # encoded once per (summary version, config version), not per request
+    def _summary_body(self):
+        key = (self.storage.summary_version, self.storage.version)
+        if self._summary_cache[0] != key:
+            body = json_body({
+                "devices": list(self.storage.summaries.values()),
+                "version": self.storage.version,
+                "broker": self.storage.broker,
+            })
+            self._summary_cache = (key, body)
+        return self._summary_cache[1]
+
+    def list_devices(self, params):
+        fields = set(params.get("fields", "").split(",")) - {""}
+        try:
+            since = int(params.get("since", -1))
+        except ValueError:
+            raise cherrypy.HTTPError(400, "since must be an integer")
+
+        filters = {index: params[index] for index in self.storage.device_index if index in params}
+        device_ids = self.storage.find_devices(**filters)
+
+        devices = []
+
+        for device_id in device_ids:
+            device = self.storage.devices_by_id[device_id]
+            if device.get("version", 0) <= since:
+                continue
+            item = {
+                "device_id": device["device_id"],
+                "device_label": device["device_label"],
+            }
+            if "resources" in fields:
+                item["resources"] = device.get("resources", [])
+                item["version"] = device.get("version", 0)
+            devices.append(item)
+
+        return {
+            "devices": devices,
+            "version": self.storage.version,
+            "broker": self.storage.broker,
+        }
+
+
+# encode a dict as a json response body
+def json_body(data):
+    cherrypy.response.headers["Content-Type"] = "application/json"
+    return json.dumps(data).encode("utf-8")
 
 
 class Root:
-    def __init__(self):
-        storage = CatalogStorage()
+    def __init__(self, storage):
         self.services = ServicesAPI(storage)
         self.devices = DevicesAPI(storage)
 
 
+# Retained config event per device: <base_topic>/<device_id>/config
+# A subscriber gets the current config of every device on (re)subscribe and each change afterwards,
+# so the monitoring service does not have to poll /devices/<id>.
+def start_config_events(storage):
+    mqtt = MQTTClient(storage.broker["broker"], int(storage.broker["port"]), client_id="service_catalogue")
+    base = storage.broker["base_topic"]
+
+    def publish(device):
+        mqtt.publish(f"{base}/{device['device_id']}/config", {
+            "device_id": device["device_id"],
+            "version": device.get("version", 0),
+            "resources": device.get("resources", []),
+            "ts": now_ts(),
+        }, qos=1, retain=True)
+
+    storage.on_thresholds_changed = publish
+    mqtt.connect()
+    cherrypy.engine.subscribe("stop", mqtt.disconnect)
+    return mqtt
+
+
 def run_server():
-    cherrypy.config.update({"server.socket_host": "0.0.0.0", "server.socket_port": 8080})
+    # every service watching GET /services?watch= holds a worker thread while it waits
+    cherrypy.config.update({"server.socket_host": "0.0.0.0", "server.socket_port": 8080, "server.thread_pool": 64})
+
+    storage = CatalogStorage()
+    start_config_events(storage)
+
+    # report instances that stopped sending heartbeats to the watchers, drop them after SERVICE_EXPIRE
+    def check_services():
+        for name, instance_id in storage.check_services():
+            print(f"[SERVICES] {name}/{instance_id} down (no heartbeat for {storage.SERVICE_TTL}s)")
+        for name in storage.expire_services():
+            print(f"[SERVICES] {name} expired (no heartbeat for {storage.SERVICE_EXPIRE}s)")
+    cherrypy.process.plugins.Monitor(cherrypy.engine, check_services, frequency=5, name="service-health").subscribe()
 
     conf = {
         "/services": {"request.dispatch": cherrypy.dispatch.MethodDispatcher()},
         "/devices": {"request.dispatch": cherrypy.dispatch.MethodDispatcher()},
     }
 
-    cherrypy.quickstart(Root(), "/", conf)
+    cherrypy.quickstart(Root(storage), "/", conf)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,25 @@
+import json
+import paho.mqtt.client as mqtt
+
+
+# Publish-only client of the catalogue (device config change events).
+# connect_async + loop_start: the catalogue starts even when the broker is down,
+# paho keeps reconnecting and queues qos 1 messages meanwhile.
+class MQTTClient:
+    def __init__(self, broker="localhost", port=1883, client_id=None):
+        self.broker = broker
+        self.port = port
+        self.client = mqtt.Client(client_id=client_id)
+
+    def connect(self):
+        self.client.connect_async(self.broker, self.port)
+        self.client.loop_start()
+
+    def disconnect(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if isinstance(payload, dict):
+            payload = json.dumps(payload)
+        self.client.publish(topic, payload, qos=qos, retain=retain)
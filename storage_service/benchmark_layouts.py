@@ -0,0 +1,113 @@
+import argparse
+import json
+import random
+import time
+
+from db import MariaDB
+
+SENSORS = ["temperature", "nitrate", "turbidity", "leakage", "Ph"]
+
+
+# Compares the "eav" and "wide" storage layouts on the same synthetic data:
+#   - insert throughput (multi-row inserts, like the write pipeline)
+#   - GET latest latency
+#   - raw history query latency (bucket 300 s, not answered by the rollups)
+# Run it against a scratch database, e.g.:
+#   python benchmark_layouts.py --database smart_aquariums_bench --devices 200 --ticks 200
+# Only rows of "bench-*" devices are written and they are deleted at the end.
+def make_rows(devices, ticks, start_ts, interval):
+    rows = []
+    for t in range(ticks):
+        ts = start_ts + t * interval
+        for d in range(devices):
+            for sensor in SENSORS:
+                rows.append((f"bench-{d}", ts, sensor, round(random.uniform(0, 50), 2)))
+    return rows
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench_layout(db, rows, devices, start_ts, end_ts, queries, batch_size):
+    # insert
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        db.insert_rows(rows[i:i + batch_size], chunk_size=batch_size, rollups=False)
+    insert_sec = time.perf_counter() - start
+
+    # latest
+    latest_ms = []
+    for _ in range(queries):
+        device_id = f"bench-{random.randrange(devices)}"
+        t0 = time.perf_counter()
+        db.get_latest(device_id)
+        latest_ms.append((time.perf_counter() - t0) * 1000.0)
+
+    # history
+    history_ms = []
+    for _ in range(queries):
+        device_id = f"bench-{random.randrange(devices)}"
+        t0 = time.perf_counter()
+        list(db.iter_history(device_id, "nitrate", start_ts, end_ts, 300))
+        history_ms.append((time.perf_counter() - t0) * 1000.0)
+
+    return {
+        "insert_rows_per_sec": round(len(rows) / insert_sec),
+        "latest_ms_p50": round(percentile(latest_ms, 0.5), 3),
+        "latest_ms_p95": round(percentile(latest_ms, 0.95), 3),
+        "history_ms_p50": round(percentile(history_ms, 0.5), 3),
+        "history_ms_p95": round(percentile(history_ms, 0.95), 3),
+    }
+
+
+def cleanup(db):
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"DELETE FROM {db.raw_table} WHERE device_id LIKE 'bench-%'")
+        cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark eav vs wide measurement layouts")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--database", help="database name (defaults to the one in config.json)")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--interval", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        db_cfg = json.load(f).get("db", {})
+
+    start_ts = int(time.time()) - args.ticks * args.interval
+    end_ts = start_ts + args.ticks * args.interval
+    rows = make_rows(args.devices, args.ticks, start_ts, args.interval)
+    print(f"[BENCH] {args.devices} devices x {args.ticks} ticks = {len(rows)} sensor values")
+
+    results = {}
+    for layout in ("eav", "wide"):
+        db = MariaDB(
+            host=db_cfg.get("host", "127.0.0.1"),
+            port=int(db_cfg.get("port", 3306)),
+            user=db_cfg.get("user", "root"),
+            password=db_cfg.get("password", ""),
+            database=args.database or db_cfg.get("name", "smart_aquariums"),
+            pool_size=1,
+            layout=layout,
+        )
+        cleanup(db)
+        try:
+            results[layout] = bench_layout(db, rows, args.devices, start_ts, end_ts, args.queries, args.batch_size)
+        finally:
+            cleanup(db)
+        print(f"[BENCH] {layout}: {results[layout]}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,67 @@
-import mariadb
+import json
+
+from db_pool import ConnectionPool
+
+# Storage layouts of the raw data
+#   "eav"  -> `measurements`      one row per (device, ts, sensor)
+#   "wide" -> `measurements_wide` one row per (device, ts), all sensors in a JSON column
+LAYOUT_TABLES = {
+    "eav": "measurements",
+    "wide": "measurements_wide",
+}
+
+
+# Rollup tables maintained on every insert: (table, bucket size in seconds), finest first
+ROLLUPS = (
+    ("measurements_hourly", 3600),
+    ("measurements_daily", 86400),
+)
+
+
+# Pre-aggregate raw rows into rollup rows for one bucket size
+# rows: [(device_id, ts, sensor, value), ...] -> [(device_id, sensor, bucket_ts, cnt, vmin, vmax, vsum), ...]
+def rollup_rows(rows, bucket):
+    agg = {}
+    for device_id, ts, sensor, value in rows:
+        key = (device_id, sensor, ts - ts % bucket)
+        a = agg.get(key)
+        if a is None:
+            agg[key] = [1, value, value, value]
+        else:
+            a[0] += 1
+            a[1] = min(a[1], value)
+            a[2] = max(a[2], value)
+            a[3] += value
+    return [key + tuple(a) for key, a in agg.items()]
+
+
+# Group raw rows per (device, ts) for the wide layout
+# rows: [(device_id, ts, sensor, value), ...] -> [(device_id, ts, json_data), ...]
+def wide_rows(rows):
+    grouped = {}
+    for device_id, ts, sensor, value in rows:
+        grouped.setdefault((device_id, ts), {})[sensor] = value
+    return [(device_id, ts, json.dumps(data)) for (device_id, ts), data in grouped.items()]
+
+
+# JSON path of a sensor inside measurements_wide.data  ->  $."nitrate"
+def json_path(sensor):
+    return "$." + json.dumps(sensor)
+
+
+# Runs "<prefix> VALUES (...), (...), ... <suffix>" in chunks of chunk_size rows
+def insert_many(cur, prefix, rows, chunk_size, suffix=""):
+    if not rows:
+        return
+    row_placeholder = "(" + ", ".join(["?"] * len(rows[0])) + ")"
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        params = [v for row in chunk for v in row]
+        cur.execute(prefix + " VALUES " + ", ".join([row_placeholder] * len(chunk)) + suffix, params)
 
 
 class MariaDB:
-    def __init__(self, host, port, user, password, database):
+    def __init__(self, host, port, user, password, database, pool_size=5, layout="eav"):
         self.config = {
             "host": host,
             "port": port,
@@ -12,13 +71,21 @@ class MariaDB:
             "autocommit": True
         }
 
-    def connect(self):
-        return mariadb.connect(**self.config)
+        if layout not in LAYOUT_TABLES:
+            raise ValueError(f"unknown storage layout: {layout}")
+        self.layout = layout
+        self.raw_table = LAYOUT_TABLES[layout]
+
+        # persistent connections shared by the MQTT writer and the REST API
+        self.pool = ConnectionPool(self.config, size=pool_size)
+
+    def connection(self):
+        return self.pool.connection()
 
     # -------------------------
-    # INSERT aggregated sensor data (from MQTT)
+    # Convert aggregated sensor data (from MQTT) into measurement rows
     # -------------------------
-    def insert_measurements(self, device_id, ts, data_dict):
+    def build_rows(self, device_id, ts, data_dict):
         """
         data_dict example:
         {
@@ -32,50 +99,295 @@ class MariaDB:
             # Store only numeric values (sensor measurements)
             if isinstance(value, (int, float, bool)):
                 rows.append((device_id, ts, sensor, float(value)))
+        return rows
+
+    # -------------------------
+    # INSERT aggregated sensor data of one device
+    # -------------------------
+    def insert_measurements(self, device_id, ts, data_dict):
+        rows = self.build_rows(device_id, ts, data_dict)
 
         # If no valid sensor data exists, do nothing
         if not rows:
             return
 
-        conn = self.connect()
-        cur = conn.cursor()
-        cur.executemany(
-            "INSERT INTO measurements (device_id, ts, sensor, value) VALUES (?, ?, ?, ?)",
-            rows
-        )
-        conn.close()
+        self.insert_rows(rows)
+
+    # -------------------------
+    # INSERT rows of many devices with multi-row INSERT statements
+    # and fold them into the hourly / daily rollups in the same transaction
+    # rows: [(device_id, ts, sensor, value), ...]
+    # -------------------------
+    def insert_rows(self, rows, chunk_size=1000, rollups=True):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            conn.begin()
+            try:
+                if self.layout == "wide":
+                    insert_many(
+                        cur,
+                        "INSERT INTO measurements_wide (device_id, ts, data)",
+                        wide_rows(rows),
+                        chunk_size,
+                        " ON DUPLICATE KEY UPDATE data = JSON_MERGE_PATCH(data, VALUES(data))"
+                    )
+                else:
+                    insert_many(cur, "INSERT INTO measurements (device_id, ts, sensor, value)", rows, chunk_size)
+
+                for table, bucket in (ROLLUPS if rollups else ()):
+                    insert_many(
+                        cur,
+                        f"INSERT INTO {table} (device_id, sensor, bucket_ts, cnt, vmin, vmax, vsum)",
+                        rollup_rows(rows, bucket),
+                        chunk_size,
+                        " ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt), vmin = LEAST(vmin, VALUES(vmin)),"
+                        " vmax = GREATEST(vmax, VALUES(vmax)), vsum = vsum + VALUES(vsum)"
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
 
     # ---------------------------------------
     # SELECT latest data for all sensors
     # ---------------------------------------
     def get_latest(self, device_id):
-        conn = self.connect()
-        cur = conn.cursor()
-
-        # 1) Get latest timestamp for the device
-        cur.execute(
-            "SELECT MAX(ts) FROM measurements WHERE device_id = ?",(device_id,)
-        )
-        row = cur.fetchone()
-        if row is None or row[0] is None:
-            conn.close()
-            return None
+        if self.layout == "wide":
+            return self._get_latest_wide(device_id)
 
-        last_ts = row[0]
+        with self.connection() as conn:
+            cur = conn.cursor()
 
-        # 2) Get all sensor values for the same timestamp
-        cur.execute(
-            "SELECT sensor, value FROM measurements WHERE device_id = ? AND ts = ?",(device_id, last_ts)
-        )
+            # 1) Get latest timestamp for the device
+            cur.execute(
+                "SELECT MAX(ts) FROM measurements WHERE device_id = ?",(device_id,)
+            )
+            row = cur.fetchone()
+            if row is None or row[0] is None:
+                return None
 
-        measurements = {}
-        for sensor, value in cur.fetchall():
-            measurements[sensor] = float(value)
+            last_ts = row[0]
 
-        conn.close()
+            # 2) Get all sensor values for the same timestamp
+            cur.execute(
+                "SELECT sensor, value FROM measurements WHERE device_id = ? AND ts = ?",(device_id, last_ts)
+            )
+
+            measurements = {}
+            for sensor, value in cur.fetchall():
+                measurements[sensor] = float(value)
 
         return {
             "device_id": device_id,
             "ts": last_ts,
             "measurements": measurements
         }
+
+    # wide layout: one primary key lookup, no reassembly
+    def _get_latest_wide(self, device_id):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT ts, data FROM measurements_wide WHERE device_id = ? ORDER BY ts DESC LIMIT 1",
+                (device_id,)
+            )
+            row = cur.fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "device_id": device_id,
+            "ts": row[0],
+            "measurements": json.loads(row[1])
+        }
+
+    # ---------------------------------------
+    # SELECT latest data of every device in one query (cache warm-up)
+    # ---------------------------------------
+    def get_latest_all(self):
+        if self.layout == "wide":
+            sql = """
+                SELECT m.device_id, m.ts, m.data
+                FROM measurements_wide m
+                JOIN (
+                    SELECT device_id, MAX(ts) AS ts
+                    FROM measurements_wide
+                    GROUP BY device_id
+                ) last ON m.device_id = last.device_id AND m.ts = last.ts
+            """
+        else:
+            sql = """
+                SELECT m.device_id, m.ts, m.sensor, m.value
+                FROM measurements m
+                JOIN (
+                    SELECT device_id, MAX(ts) AS ts
+                    FROM measurements
+                    GROUP BY device_id
+                ) last ON m.device_id = last.device_id AND m.ts = last.ts
+            """
+
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql)
+            rows = cur.fetchall()
+
+        if self.layout == "wide":
+            return [
+                {"device_id": device_id, "ts": ts, "measurements": json.loads(data)}
+                for device_id, ts, data in rows
+            ]
+
+        latest = {}
+        for device_id, ts, sensor, value in rows:
+            snap = latest.setdefault(device_id, {
+                "device_id": device_id,
+                "ts": ts,
+                "measurements": {}
+            })
+            snap["measurements"][sensor] = float(value)
+
+        return list(latest.values())
+
+    # ---------------------------------------
+    # Source of a history query: the coarsest rollup whose bucket size divides
+    # the requested bucket, or the raw table -> (table, rollup bucket or None)
+    # ---------------------------------------
+    def history_source(self, bucket):
+        for table, size in reversed(ROLLUPS):
+            if bucket % size == 0:
+                return table, size
+        return self.raw_table, None
+
+    # ---------------------------------------
+    # SELECT downsampled history of one sensor (count/min/max/avg per bucket)
+    # generator: buckets are read fetch_size at a time, one query per page starting after the
+    # last bucket, so a long range is never held in memory at once and a pooled connection is
+    # only taken for the query itself (not while the caller sends the points to a slow client)
+    # ---------------------------------------
+    def iter_history(self, device_id, sensor, ts_from, ts_to, bucket, fetch_size=1000):
+        table, size = self.history_source(bucket)
+
+        if size is None and self.layout == "wide":
+            # raw rows over the (device_id, ts) primary key, sensor value extracted from the JSON column
+            sql = """
+                SELECT ts - MOD(ts, ?) AS bucket_ts, COUNT(v), MIN(v), MAX(v), AVG(v)
+                FROM (
+                    SELECT ts, JSON_VALUE(data, ?) + 0 AS v
+                    FROM measurements_wide
+                    WHERE device_id = ? AND ts >= ? AND ts < ?
+                ) x
+                WHERE v IS NOT NULL
+                GROUP BY bucket_ts
+                ORDER BY bucket_ts
+                LIMIT ?
+            """
+            key = (json_path(sensor), device_id)
+        elif size is None:
+            # raw rows, over idx_device_sensor_ts
+            sql = """
+                SELECT ts - MOD(ts, ?) AS bucket_ts, COUNT(*), MIN(value), MAX(value), AVG(value)
+                FROM measurements FORCE INDEX (idx_device_sensor_ts)
+                WHERE device_id = ? AND sensor = ? AND ts >= ? AND ts < ?
+                GROUP BY bucket_ts
+                ORDER BY bucket_ts
+                LIMIT ?
+            """
+            key = (device_id, sensor)
+        else:
+            # re-aggregate rollup buckets into the requested bucket (range aligned to the rollup bucket)
+            ts_from -= ts_from % size
+            sql = f"""
+                SELECT bucket_ts - MOD(bucket_ts, ?) AS b, SUM(cnt), MIN(vmin), MAX(vmax), SUM(vsum) / SUM(cnt)
+                FROM {table}
+                WHERE device_id = ? AND sensor = ? AND bucket_ts >= ? AND bucket_ts < ?
+                GROUP BY b
+                ORDER BY b
+                LIMIT ?
+            """
+            key = (device_id, sensor)
+
+        while ts_from < ts_to:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute(sql, (bucket, *key, ts_from, ts_to, fetch_size))
+                    rows = cur.fetchall()
+                finally:
+                    cur.close()
+
+            for bucket_ts, count, vmin, vmax, vavg in rows:
+                yield {
+                    "ts": int(bucket_ts),
+                    "count": int(count),
+                    "min": float(vmin),
+                    "max": float(vmax),
+                    "avg": float(vavg),
+                }
+            if len(rows) < fetch_size:
+                break
+            # next page starts at the bucket after the last one (bucket starts are multiples of bucket)
+            ts_from = int(rows[-1][0]) + bucket
+
+    # ---------------------------------------
+    # Partition / retention helpers (used by retention.RetentionManager)
+    # ---------------------------------------
+
+    # [(partition_name, upper_bound)] ordered by bound - upper_bound is None for MAXVALUE
+    # empty list if the table is not partitioned
+    def list_partitions(self, table):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+                FROM INFORMATION_SCHEMA.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = ? AND PARTITION_NAME IS NOT NULL
+                ORDER BY PARTITION_ORDINAL_POSITION
+                """,
+                (table,)
+            )
+            rows = cur.fetchall()
+            cur.close()
+
+        return [(name, None if desc == "MAXVALUE" else int(desc)) for name, desc in rows]
+
+    # split the catch-all `pmax` partition: new_partitions = [(name, upper_bound), ...]
+    def add_partitions(self, table, new_partitions):
+        parts = [f"PARTITION {name} VALUES LESS THAN ({bound})" for name, bound in new_partitions]
+        parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({', '.join(parts)})")
+            cur.close()
+
+    # dropping a partition is a metadata operation - no row by row delete, no index churn
+    def drop_partitions(self, table, names):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(names)}")
+            cur.close()
+
+    # smallest value of a column (e.g. oldest ts of a table), None if the table is empty
+    def min_value(self, table, column):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT MIN({column}) FROM {table}")
+            (value,) = cur.fetchone()
+            cur.close()
+        return None if value is None else int(value)
+
+    # DELETE rows older than cutoff in small chunks (rollups, or a raw table that is not partitioned)
+    def delete_older_than(self, table, column, cutoff, chunk_size=10000):
+        deleted = 0
+        with self.connection() as conn:
+            cur = conn.cursor()
+            while True:
+                cur.execute(f"DELETE FROM {table} WHERE {column} < ? LIMIT {int(chunk_size)}", (cutoff,))
+                deleted += cur.rowcount
+                if cur.rowcount < chunk_size:
+                    break
+            cur.close()
+        return deleted
@@ -0,0 +1,57 @@
+import threading
+
+
+# Latest snapshot of every device, kept up to date from the MQTT messages.
+# device_id -> {"device_id": ..., "ts": ..., "measurements": {sensor: value}}
+# Snapshots are never modified in place (a newer message replaces the whole dict),
+# so the API threads can return them without copying.
+class LatestCache:
+    def __init__(self):
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "updates": 0}
+
+    def update(self, device_id, ts, measurements):
+        if not measurements:
+            return
+
+        with self._lock:
+            current = self._latest.get(device_id)
+
+            # ignore late / out of order messages
+            if current is not None and ts < current["ts"]:
+                return
+
+            # same timestamp -> same reading split in several rows / messages, merge them
+            if current is not None and ts == current["ts"]:
+                merged = dict(current["measurements"])
+                merged.update(measurements)
+                measurements = merged
+
+            self._latest[device_id] = {
+                "device_id": device_id,
+                "ts": ts,
+                "measurements": dict(measurements),
+            }
+            self.stats["updates"] += 1
+
+    def get(self, device_id):
+        with self._lock:
+            snapshot = self._latest.get(device_id)
+            if snapshot is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits"] += 1
+            return snapshot
+
+    # fill the cache after a restart (one bulk query, see MariaDB.get_latest_all)
+    def warm(self, snapshots):
+        for snap in snapshots:
+            self.update(snap["device_id"], snap["ts"], snap["measurements"])
+        return len(self._latest)
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["devices"] = len(self._latest)
+        return out
@@ -4,6 +4,10 @@ import cherrypy
 
 from mqtt_client import MQTTClient
 from db import MariaDB
+from writer import MeasurementWriter
+from latest_cache import LatestCache
+from retention import RetentionManager
+from spool import Spool, SpoolReplayer
 from service_registry import ServiceRegistry
 
 
@@ -15,21 +19,24 @@ def load_config(path="config.json"):
 def now_ts():
     return int(time.time())
 
-# It subscribes to a topic, gets the mqtt data , and saves it in the db system
+# It subscribes to a topic, gets the mqtt data , and hands it to the write pipeline (batched db inserts)
 class StorageMQTTWorker:
-    def __init__(self, db, mqtt, topic):
+    def __init__(self, db, mqtt, topic, writer, latest):
         self.db = db
         self.mqtt = mqtt
         self.topic = topic
+        self.writer = writer
+        self.latest = latest
 
     def start(self):
+        self.writer.start()
         self.mqtt.connect()
         self.mqtt.subscribe(self.topic, self.on_message, qos=0)  # aquarium/+/sensors/agg
         print(f"[MQTT] SUB -> {self.topic}")
 
     def on_message(self, topic, payload_str):
-        
-        
+        # runs on the paho network thread: parse, enqueue, return - the db is never touched here
+        try:
             payload = json.loads(payload_str)
 
             device_id = payload["device_id"] # extract device id 
@@ -39,7 +46,15 @@ class StorageMQTTWorker:
             data.pop("device_id") # remove device_id from payload
             data.pop("ts", None)  # remove timesatamp from payload
 
-            self.db.insert_measurements(str(device_id), int(ts), data) # insert sensed data in db 
+            rows = self.db.build_rows(str(device_id), int(ts), data)
+        except Exception as e:
+            print(f"[MQTT] invalid message on {topic} -> {e}")
+            return
+
+        self.writer.enqueue(rows) # queued , the writer thread inserts it in db with other devices' rows (or spools it to disk)
+
+        # keep the latest snapshot in memory for GET /devices/<id>/latest
+        self.latest.update(str(device_id), int(ts), {sensor: value for _, _, sensor, value in rows})
 
  #-------------------------------------------------------------------------------------------------       
 
@@ -48,18 +63,42 @@ class StorageMQTTWorker:
 class StorageAPI:
     exposed = True
 
-    def __init__(self, db):
+    HISTORY_CHUNK_POINTS = 500 # points per streamed chunk
+
+    def __init__(self, db, writer, latest):
         self.db = db
+        self.writer = writer
+        self.latest = latest
 
-    @cherrypy.tools.json_out()
     def GET(self, *uri, **params):
+        # GET /devices/<device_id>/history -> streamed json
+        if len(uri) == 3 and uri[0] == "devices" and uri[2] == "history":
+            return self.history(uri[1], params)
+
+        return json_body(self.handle_get(uri, params))
+
+    def handle_get(self, uri, params):
+        # GET /stats -> write pipeline and connection pool counters
+        if uri == ("stats",):
+            return {
+                "status": "ok",
+                "writer": self.writer.snapshot(),
+                "db_pool": self.db.pool.snapshot(),
+                "latest_cache": self.latest.snapshot(),
+                "spool": self.writer.spool.snapshot(),
+            }
+
         # GET /devices/<device_id>/latest
         if len(uri) != 3 or uri[0] != "devices" or uri[2] != "latest":
             cherrypy.response.status = 404
             return {"status": "error", "message": "Not found"}
 
         device_id = uri[1]
-        result = self.db.get_latest(str(device_id)) # get the latest data for specified device_id from database 
+        result = self.latest.get(str(device_id)) # served from memory (filled by the MQTT worker)
+        if result is None:
+            result = self.db.get_latest(str(device_id)) # cold cache -> get the latest data for specified device_id from database 
+            if result is not None:
+                self.latest.update(result["device_id"], result["ts"], result["measurements"])
         if result is None: # if result is none throw an error 
             cherrypy.response.status = 404
             return {
@@ -70,6 +109,72 @@ class StorageAPI:
 
         return {"status": "ok", "device_id": device_id, "data": result} # send the latest data as json 
 
+    # GET /devices/<device_id>/history?sensor=nitrate&from=<ts>&to=<ts>&bucket=<sec>
+    # min/max/avg per bucket computed by the db, streamed as chunked json
+    def history(self, device_id, params):
+        sensor = params.get("sensor")
+        if not sensor:
+            cherrypy.response.status = 400
+            return json_body({"status": "error", "message": "sensor is required"})
+
+        try:
+            ts_to = int(params.get("to", now_ts()))
+            ts_from = int(params.get("from", ts_to - 24 * 3600))
+            bucket = int(params.get("bucket", 300))
+        except ValueError:
+            cherrypy.response.status = 400
+            return json_body({"status": "error", "message": "from, to and bucket must be integers"})
+
+        if bucket <= 0 or ts_from >= ts_to:
+            cherrypy.response.status = 400
+            return json_body({"status": "error", "message": "bucket must be > 0 and from < to"})
+
+        points = self.db.iter_history(str(device_id), sensor, ts_from, ts_to, bucket)
+        try:
+            first = next(points, None) # runs the query, so db errors are still reported with a status code
+        except Exception as e:
+            cherrypy.response.status = 503
+            return json_body({"status": "error", "message": f"history query failed: {e}"})
+
+        source, size = self.db.history_source(bucket) # raw table or the rollup that answered
+        header = {
+            "status": "ok",
+            "device_id": str(device_id),
+            "sensor": sensor,
+            "from": ts_from - ts_from % size if size else ts_from, # a rollup answers from its bucket start
+            "to": ts_to,
+            "bucket": bucket,
+            "source": source,
+        }
+
+        cherrypy.response.headers["Content-Type"] = "application/json"
+        cherrypy.response.stream = True
+        return self._stream_history(header, first, points)
+
+    def _stream_history(self, header, first, points):
+        # {"status": "ok", ..., "points": [ {...}, {...} ]}
+        yield (json.dumps(header)[:-1] + ', "points": [').encode("utf-8")
+
+        if first is not None:
+            chunk = [json.dumps(first)]
+            sep = "" # written before every chunk but the first
+            for p in points:
+                chunk.append(json.dumps(p))
+                if len(chunk) >= self.HISTORY_CHUNK_POINTS:
+                    yield (sep + ", ".join(chunk)).encode("utf-8")
+                    chunk = []
+                    sep = ", "
+            if chunk:
+                yield (sep + ", ".join(chunk)).encode("utf-8")
+
+        yield b"]}"
+
+
+# encode a dict as a json response body
+def json_body(data):
+    cherrypy.response.headers["Content-Type"] = "application/json"
+    return json.dumps(data).encode("utf-8")
+
  #-------------------------------------------------------------------------------------------------      
 
 def main():
@@ -81,6 +186,9 @@ def main():
     db_cfg = cfg.get("db", {})
     mqtt_cfg = cfg.get("mqtt", {})
     cat_cfg = cfg.get("catalogue", {})
+    writer_cfg = cfg.get("writer", {})
+    retention_cfg = cfg.get("retention", {})
+    spool_cfg = cfg.get("spool", {})
 
     service_name = service_cfg.get("name", "storage_service")
 
@@ -102,17 +210,51 @@ def main():
         user=db_cfg.get("user", "root"),
         password=db_cfg.get("password", ""),
         database=db_cfg.get("name", "smart_aquariums"),
+        pool_size=int(db_cfg.get("pool_size", 5)),
+        layout=db_cfg.get("layout", "eav"), # "eav" (row per sensor) or "wide" (row per device + timestamp)
+    )
+
+    # on-disk spool for rows the db cannot take right now (down or too slow)
+    spool = Spool(
+        spool_cfg.get("dir", "spool"),
+        segment_max_bytes=int(spool_cfg.get("segment_max_mb", 4)) * 1024 * 1024,
+        fsync=spool_cfg.get("fsync", "interval"),
+        fsync_interval_ms=int(spool_cfg.get("fsync_interval_ms", 1000)),
+    )
+    replayer = SpoolReplayer(
+        db,
+        spool,
+        interval_sec=int(spool_cfg.get("replay_interval_sec", 5)),
+        chunk_size=int(writer_cfg.get("batch_size", 500)),
+    )
+
+    # batched write pipeline (MQTT -> buffer -> multi-row inserts)
+    writer = MeasurementWriter(
+        db,
+        spool,
+        batch_size=int(writer_cfg.get("batch_size", 500)),
+        flush_interval_ms=int(writer_cfg.get("flush_interval_ms", 200)),
+        max_queue=int(writer_cfg.get("max_queue", 50000)),
+        max_spill=int(writer_cfg.get("max_spill", 10000)),
     )
 
     # the Storage service registers itself in the service catalog
     registry = ServiceRegistry(catalog_host, catalog_port)
     registry.register(service_name, advertise_host, http_port)
+    registry.start_heartbeat()
     print(f"[REG] {service_name} -> http://{advertise_host}:{http_port}")
 
 
+    # latest snapshot per device, warmed with one bulk query so reports are served from memory after a restart
+    latest = LatestCache()
+    try:
+        print(f"[CACHE] warmed latest snapshot of {latest.warm(db.get_latest_all())} devices")
+    except Exception as e:
+        print(f"[CACHE] warm-up failed -> {e}")
+
     # instantiate MQTT client class 
     mqtt = MQTTClient(broker=mqtt_broker, port=mqtt_port, client_id=service_name)
-    StorageMQTTWorker(db, mqtt, mqtt_topic).start()
+    StorageMQTTWorker(db, mqtt, mqtt_topic, writer, latest).start()
 
     cherrypy.config.update({
         "server.socket_host": bind_host,
@@ -120,7 +262,26 @@ def main():
     })
 
     conf = {"/": {"request.dispatch": cherrypy.dispatch.MethodDispatcher()}}
-    cherrypy.tree.mount(StorageAPI(db), "/", conf)
+    cherrypy.tree.mount(StorageAPI(db, writer, latest), "/", conf)
+
+    # write what is still buffered when the service stops
+    cherrypy.engine.subscribe("stop", writer.stop)
+
+    # drain the spool once the db is reachable again
+    replayer.start()
+    cherrypy.engine.subscribe("stop", replayer.stop)
+
+    # drop expired raw partitions / rollup buckets on a schedule
+    if retention_cfg.get("enabled", True):
+        retention = RetentionManager(
+            db,
+            tiers=retention_cfg.get("tiers", {"raw": 30, "hourly": 365, "daily": None}),
+            interval_sec=int(retention_cfg.get("interval_sec", 3600)),
+            partition_days=int(retention_cfg.get("partition_days", 1)),
+            precreate_partitions=int(retention_cfg.get("precreate_partitions", 3)),
+        )
+        retention.start()
+        cherrypy.engine.subscribe("stop", retention.stop)
 
     cherrypy.engine.start()
     cherrypy.engine.block()
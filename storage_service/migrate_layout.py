@@ -0,0 +1,78 @@
+import argparse
+import json
+
+from db import MariaDB, wide_rows
+
+
+# Copies the EAV table `measurements` into `measurements_wide` (one row per device + timestamp).
+# Rows are streamed ordered by (device_id, ts) with an unbuffered cursor and written in batches,
+# so the table is never loaded in memory. Safe to run again: rows of the same device + timestamp are merged.
+#
+#   python migrate_layout.py                      # everything
+#   python migrate_layout.py --from 1700000000    # only ts >= 1700000000
+def migrate(db, ts_from=0, batch_size=5000):
+    copied = 0
+    batch = []
+
+    with db.connection() as conn:
+        cur = conn.cursor(buffered=False)
+        cur.execute(
+            "SELECT device_id, ts, sensor, value FROM measurements WHERE ts >= ? ORDER BY device_id, ts",
+            (ts_from,)
+        )
+
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            batch.extend(rows)
+
+            # keep the last (device, ts) group open, its other sensors may be in the next fetch
+            last_key = batch[-1][:2]
+            split = len(batch)
+            while split > 0 and batch[split - 1][:2] == last_key:
+                split -= 1
+            if split == 0:
+                continue
+
+            done, batch = batch[:split], batch[split:]
+            db.insert_rows(done, chunk_size=1000, rollups=False) # rollups already contain these rows
+            copied += len(wide_rows(done))
+            print(f"[MIGRATE] {copied} wide rows written")
+
+        cur.close()
+
+    if batch:
+        db.insert_rows(batch, chunk_size=1000, rollups=False)
+        copied += len(wide_rows(batch))
+
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy measurements (EAV) into measurements_wide")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--from", dest="ts_from", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        db_cfg = json.load(f).get("db", {})
+
+    # reads through its own connection, writes through a second one of the pool
+    db = MariaDB(
+        host=db_cfg.get("host", "127.0.0.1"),
+        port=int(db_cfg.get("port", 3306)),
+        user=db_cfg.get("user", "root"),
+        password=db_cfg.get("password", ""),
+        database=db_cfg.get("name", "smart_aquariums"),
+        pool_size=2,
+        layout="wide",
+    )
+
+    copied = migrate(db, args.ts_from, args.batch_size)
+    print(f"[MIGRATE] done, {copied} wide rows written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+DAY = 86400
+
+
+# Retention of stored data, one tier per table:
+#   raw    -> `measurements` / `measurements_wide` (db.raw_table), range partitioned by ts
+#             (one partition per `partition_days`)
+#   hourly -> `measurements_hourly`
+#   daily  -> `measurements_daily`
+# Expired raw data is removed by dropping whole partitions; beyond the raw window
+# only the rollups are kept. Tier value = days to keep, None = keep forever.
+class RetentionManager:
+    ROLLUP_TIERS = (("hourly", "measurements_hourly"), ("daily", "measurements_daily"))
+
+    def __init__(self, db, tiers, interval_sec=3600, partition_days=1, precreate_partitions=3):
+        self.db = db
+        self.raw_table = db.raw_table
+        self.tiers = tiers
+        self.interval = int(interval_sec)
+        self.partition_sec = int(partition_days) * DAY
+        self.precreate = int(precreate_partitions)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once(int(time.time()))
+            except Exception as e:
+                print(f"[RETENTION] run failed -> {e}")
+            self._stop.wait(self.interval)
+
+    def run_once(self, now):
+        partitions = self.db.list_partitions(self.raw_table)
+        raw_days = self.tiers.get("raw")
+
+        if partitions:
+            cutoff = now - raw_days * DAY if raw_days else None
+            if self.ensure_partitions(partitions, now, cutoff):
+                partitions = self.db.list_partitions(self.raw_table)
+            if cutoff is not None:
+                self.drop_expired(partitions, cutoff)
+        elif raw_days:
+            # table not partitioned yet (see database_files/measurements_partitioning.sql) -> slow path
+            deleted = self.db.delete_older_than(self.raw_table, "ts", now - raw_days * DAY)
+            print(f"[RETENTION] {self.raw_table} is not partitioned, deleted {deleted} rows")
+
+        for tier, table in self.ROLLUP_TIERS:
+            days = self.tiers.get(tier)
+            if days:
+                deleted = self.db.delete_older_than(table, "bucket_ts", now - days * DAY)
+                if deleted:
+                    print(f"[RETENTION] {table}: deleted {deleted} expired buckets")
+
+    # make sure partitions exist for the next `precreate_partitions` periods,
+    # so pmax (catch-all) stays empty and splitting it is cheap -> True if partitions were added
+    # The first run (only pmax) also splits the rows already stored: partitions start at the oldest
+    # row, or with one partition holding every row older than the retention cutoff, which
+    # drop_expired removes in the same run.
+    def ensure_partitions(self, partitions, now, cutoff=None):
+        bounds = [bound for _, bound in partitions if bound is not None]
+        if bounds:
+            start = max(bounds)
+        else:
+            start = now - now % self.partition_sec
+            oldest = self.db.min_value(self.raw_table, "ts")
+            if oldest is not None:
+                start = min(start, oldest - oldest % self.partition_sec)
+                if cutoff is not None:
+                    start = max(start, cutoff - cutoff % self.partition_sec - self.partition_sec)
+        horizon = now - now % self.partition_sec + (self.precreate + 1) * self.partition_sec
+
+        new_partitions = []
+        while start < horizon:
+            name = "p" + datetime.fromtimestamp(start, timezone.utc).strftime("%Y%m%d")
+            new_partitions.append((name, start + self.partition_sec))
+            start += self.partition_sec
+
+        if new_partitions:
+            self.db.add_partitions(self.raw_table, new_partitions)
+            print(f"[RETENTION] {self.raw_table}: added partitions {[n for n, _ in new_partitions]}")
+        return bool(new_partitions)
+
+    # a partition can go when all of its rows are older than cutoff
+    def drop_expired(self, partitions, cutoff):
+        expired = [name for name, bound in partitions if bound is not None and bound <= cutoff]
+        if expired:
+            self.db.drop_partitions(self.raw_table, expired)
+            print(f"[RETENTION] {self.raw_table}: dropped partitions {expired}")
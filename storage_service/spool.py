@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+
+
+# Append-only on-disk spool for measurement rows that could not be written to the db
+# (db down, or the write buffer is full because the db is slow).
+# - rows are appended as one JSON line per batch to the current segment file
+# - a segment is sealed when it reaches `segment_max_bytes` (or when the replayer wants it)
+# - sealed segments are replayed oldest first and deleted once they are in the db
+# fsync policy: "always" (every append), "interval" (at most every fsync_interval_ms), "never" (leave it to the OS)
+class Spool:
+    def __init__(self, directory, segment_max_bytes=4 * 1024 * 1024, fsync="interval", fsync_interval_ms=1000):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"unknown fsync policy: {fsync}")
+
+        self.directory = directory
+        self.segment_max_bytes = int(segment_max_bytes)
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval_ms) / 1000.0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = None  # current (open) segment
+        self._file_path = None
+        self._last_fsync = 0.0
+
+        # continue numbering after the segments left by a previous run
+        existing = self.segments()
+        self._next_seq = self._seq(existing[-1]) + 1 if existing else 1
+
+        self.stats = {
+            "spooled_rows": 0,
+            "spooled_batches": 0,
+            "replayed_rows": 0,
+            "corrupt_lines": 0,
+        }
+
+    @staticmethod
+    def _seq(path):
+        return int(os.path.basename(path)[4:-4])  # seg-000000000001.log
+
+    # all segment files, oldest first (including the one being written)
+    def segments(self):
+        names = [n for n in os.listdir(self.directory) if n.startswith("seg-") and n.endswith(".log")]
+        return [os.path.join(self.directory, n) for n in sorted(names)]
+
+    def append(self, rows):
+        if not rows:
+            return
+        line = (json.dumps(rows) + "\n").encode("utf-8")
+
+        with self._lock:
+            if self._file is None:
+                self._file_path = os.path.join(self.directory, f"seg-{self._next_seq:012d}.log")
+                self._next_seq += 1
+                self._file = open(self._file_path, "ab")
+
+            self._file.write(line)
+            self._file.flush()
+
+            now = time.monotonic()
+            if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+            self.stats["spooled_rows"] += len(rows)
+            self.stats["spooled_batches"] += 1
+
+            if self._file.tell() >= self.segment_max_bytes:
+                self._seal_locked()
+
+    def _seal_locked(self):
+        if self._file is None:
+            return
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._file_path = None
+
+    # close the current segment so it can be replayed
+    def seal(self):
+        with self._lock:
+            self._seal_locked()
+
+    # sealed segments, oldest first
+    def sealed_segments(self):
+        with self._lock:
+            current = self._file_path
+        return [p for p in self.segments() if p != current]
+
+    # rows of a segment - a torn last line (crash while writing) is skipped
+    def read_segment(self, path):
+        rows = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    rows.extend(tuple(r) for r in json.loads(line))
+                except ValueError:
+                    with self._lock:
+                        self.stats["corrupt_lines"] += 1
+        return rows
+
+    def remove(self, path, replayed_rows):
+        os.remove(path)
+        with self._lock:
+            self.stats["replayed_rows"] += replayed_rows
+
+    def snapshot(self):
+        segments = self.segments()
+        with self._lock:
+            out = dict(self.stats)
+        out["segments"] = len(segments)
+        out["pending_bytes"] = sum(os.path.getsize(p) for p in segments)
+        return out
+
+
+# Drains the spool into the db in large batches once the db is reachable again.
+# One segment = one transaction (db.insert_rows), deleted after commit.
+# A crash between commit and delete replays that segment again (at-least-once).
+class SpoolReplayer:
+    def __init__(self, db, spool, interval_sec=5, chunk_size=1000):
+        self.db = db
+        self.spool = spool
+        self.interval = float(interval_sec)
+        self.chunk_size = int(chunk_size)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.replay()
+            except Exception as e:
+                print(f"[SPOOL] replay paused, db still unavailable -> {e}")
+
+    def replay(self):
+        if not self.spool.sealed_segments():
+            self.spool.seal() # recent spilled rows become replayable too
+        for path in self.spool.sealed_segments():
+            if self._stop.is_set():
+                return
+            rows = self.spool.read_segment(path)
+            if rows:
+                self.db.insert_rows(rows, chunk_size=self.chunk_size)
+            self.spool.remove(path, len(rows))
+            print(f"[SPOOL] replayed {len(rows)} rows from {os.path.basename(path)}")
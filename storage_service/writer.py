@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+
+
+# Write pipeline between the MQTT thread and MariaDB.
+# on_message only appends rows to an in-memory buffer; a background thread
+# coalesces the rows of all devices and writes them with multi-row INSERTs.
+# A flush happens when `batch_size` rows are waiting or when the oldest
+# waiting row is `flush_interval_ms` old.
+# Rows that do not fit in the buffer (db slow) or whose flush failed (db down)
+# go to the on-disk spool, which is drained later by spool.SpoolReplayer.
+# The MQTT thread never does file I/O: its overflow is handed to a spill thread through a bounded
+# queue (max_spill messages); when that is full too the rows are dropped and counted.
+class MeasurementWriter:
+    def __init__(self, db, spool, batch_size=500, flush_interval_ms=200, max_queue=50000, max_spill=10000):
+        self.db = db
+        self.spool = spool
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval_ms) / 1000.0
+        self.max_queue = int(max_queue)
+
+        self._rows = []  # pending rows [(device_id, ts, sensor, value), ...]
+        self._oldest = None  # monotonic time of the oldest pending row
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="measurement-writer", daemon=True)
+        self._overflow = queue.Queue(maxsize=int(max_spill))  # row lists waiting for the spool, None = stop
+        self._spiller = threading.Thread(target=self._run_spill, name="measurement-spill", daemon=True)
+
+        self.stats = {
+            "enqueued_rows": 0,
+            "written_rows": 0,
+            "spilled_rows": 0,
+            "lost_rows": 0,
+            "dropped_rows": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "flush_ms_last": 0.0,
+            "flush_ms_max": 0.0,
+            "flush_ms_total": 0.0,
+        }
+
+    def start(self):
+        self._thread.start()
+        self._spiller.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join()
+        self._overflow.put(None)
+        self._spiller.join()
+
+    # Called from the MQTT thread - never touches the db or the disk, never waits for them
+    def enqueue(self, rows):
+        if not rows:
+            return True
+
+        with self._cond:
+            full = len(self._rows) + len(rows) > self.max_queue
+            if not full:
+                if not self._rows:
+                    self._oldest = time.monotonic()
+                self._rows.extend(rows)
+                self.stats["enqueued_rows"] += len(rows)
+
+                if len(self._rows) >= self.batch_size:
+                    self._cond.notify()
+                return True
+
+        # db too slow to keep up -> overflow to disk (by the spill thread)
+        try:
+            self._overflow.put_nowait(rows)
+            counter = "spilled_rows"
+        except queue.Full:
+            counter = "dropped_rows"  # the disk cannot keep up either
+        with self._cond:
+            self.stats[counter] += len(rows)
+        return False
+
+    # wait until there is a batch to write (size or deadline) and take it
+    def _next_batch(self):
+        with self._cond:
+            while not self._rows and not self._stop:
+                self._cond.wait()
+
+            while self._rows and len(self._rows) < self.batch_size and not self._stop:
+                remaining = self._oldest + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._rows
+            self._rows = []
+            self._oldest = None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stop:
+                return
+
+    def _flush(self, batch):
+        start = time.monotonic()
+        try:
+            self.db.insert_rows(batch, chunk_size=self.batch_size)
+            ok = True
+        except Exception as e:
+            print(f"[WRITER] flush of {len(batch)} rows failed, spooling to disk -> {e}")
+            ok = False
+            self._spill(batch)
+        flush_ms = (time.monotonic() - start) * 1000.0
+
+        with self._cond:
+            self.stats["flushes"] += 1
+            self.stats["flush_ms_last"] = flush_ms
+            self.stats["flush_ms_max"] = max(self.stats["flush_ms_max"], flush_ms)
+            self.stats["flush_ms_total"] += flush_ms
+            if ok:
+                self.stats["written_rows"] += len(batch)
+            else:
+                self.stats["failed_flushes"] += 1
+                self.stats["spilled_rows"] += len(batch)
+
+    # spill thread: everything waiting in the overflow queue goes to the spool in one append
+    def _run_spill(self):
+        while True:
+            rows = self._overflow.get()
+            stop = rows is None
+            rows = list(rows or [])
+            while True:
+                try:
+                    more = self._overflow.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                else:
+                    rows.extend(more)
+            if rows:
+                self._spill(rows)
+            if stop:
+                return
+
+    def _spill(self, rows):
+        try:
+            self.spool.append(rows)
+        except Exception as e:
+            print(f"[WRITER] spool write failed, {len(rows)} rows lost -> {e}")
+            with self._cond:
+                self.stats["lost_rows"] += len(rows)
+
+    def snapshot(self):
+        with self._cond:
+            out = dict(self.stats)
+            out["queue_depth"] = len(self._rows)
+            out["spill_queue_depth"] = self._overflow.qsize()
+            out["oldest_row_age_ms"] = (time.monotonic() - self._oldest) * 1000.0 if self._oldest else 0.0
+        out["flush_ms_avg"] = out["flush_ms_total"] / out["flushes"] if out["flushes"] else 0.0
+        return out
@@ -1,11 +1,11 @@
 import json
 import time
-import requests
 import telepot
 from telepot.loop import MessageLoop
 from datetime import datetime
 from mqtt_client import MQTTClient
 from service_registry import ServiceRegistry
+from service_discovery import ServiceDiscovery
 
 
 def load_config(path="config.telegram.json"):
@@ -25,23 +25,15 @@ class TelegramAquaBot:
         self.user_catalogue_name = user_catalogue_name
         self.storage_name = storage_name
 
-        self.user_catalogue_url = ""
-        self.storage_url = ""
+        # user catalogue / storage instances, resolved through the catalogue and balanced per call
+        self.discovery = ServiceDiscovery(self.catalog_base)
 
         self.device_labels = {}  # device_id -> label
 
     # --- service discovery ---
     def discover(self):
-        self.user_catalogue_url = self._service_url(self.user_catalogue_name)
-        self.storage_url = self._service_url(self.storage_name)
-
-        print("[DISCOVERY] user_catalogue =", self.user_catalogue_url)
-        print("[DISCOVERY] storage       =", self.storage_url)
-
-    def _service_url(self, name):
-        r = requests.get(f"{self.catalog_base}/services/{name}", timeout=4)
-        j = r.json()
-        return j["service"]["url"].rstrip("/")
+        print("[DISCOVERY] user_catalogue =", [i["url"] for i in self.discovery.instances(self.user_catalogue_name)])
+        print("[DISCOVERY] storage       =", [i["url"] for i in self.discovery.instances(self.storage_name)])
 
     # --- telegram helpers ---
     def send(self, chat_id, text, markup=None):
@@ -89,23 +81,23 @@ class TelegramAquaBot:
 
     # --- HTTP calls ---
     def auth(self, password, chat_id):
-        r = requests.post(
-            f"{self.user_catalogue_url}/auth",
+        r = self.discovery.request(
+            self.user_catalogue_name, "POST", "/auth",
             json={"password": password, "chat_id": str(chat_id)},
             timeout=5,
         )
         return r.json()
 
     def latest_report(self, device_id):
-        r = requests.get(
-            f"{self.storage_url}/devices/{device_id}/latest",
+        r = self.discovery.request(
+            self.storage_name, "GET", f"/devices/{device_id}/latest",
             timeout=5,
         )
         return r.json()
 
     def device_chat_ids(self, device_id):
-        r = requests.get(
-            f"{self.user_catalogue_url}/device_chat_ids",
+        r = self.discovery.request(
+            self.user_catalogue_name, "GET", "/device_chat_ids",
             params={"device_id": device_id},
             timeout=5,
         )
@@ -202,6 +194,7 @@ class TelegramAquaBot:
 
     def start(self):
         self.discover()
+        self.discovery.start_watch() # redeployed / new instances are picked up without a restart
 
         self.mqtt.connect()
         self.mqtt.subscribe("aquarium/+/alerts", self.on_alert)
@@ -228,7 +221,9 @@ def main():
 
     user_catalogue_name = cfg["services"]["user_catalogue_name"]
     storage_name = cfg["services"]["storage_name"]
-    ServiceRegistry(catalog_host, catalog_port).register("telegram_bot", "localhost", 8011)
+    registry = ServiceRegistry(catalog_host, catalog_port)
+    registry.register("telegram_bot", "localhost", 8011)
+    registry.start_heartbeat()
 
     mqtt = MQTTClient(
         broker=mqtt_broker,
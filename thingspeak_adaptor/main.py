@@ -291,6 +291,7 @@ def main():
 
     registry = ServiceRegistry(cfg["catalog_host"], cfg["catalog_port"])
     registry.register(cfg["service_name"], cfg["host"], cfg["port"])
+    registry.start_heartbeat()
 
     api = API(store, ts, "http://" + cfg["catalog_host"] + ":" + str(cfg["catalog_port"]))
     cherrypy.config.update({